@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+🧩 Icon Atlas Packer
+Packs processed icons into texture atlases per density with a JSON and
+plist coordinate index, so clients load one texture and slice it
+"""
+
+import json
+import math
+import time
+import logging
+import plistlib
+import argparse
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Tuple
+
+from PIL import Image
+
+import icon_generator_v2 as generator
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Rect:
+    """Axis-aligned rectangle in atlas pixels"""
+    x: int
+    y: int
+    width: int
+    height: int
+    
+    @property
+    def right(self) -> int:
+        return self.x + self.width
+    
+    @property
+    def bottom(self) -> int:
+        return self.y + self.height
+    
+    def intersects(self, other: 'Rect') -> bool:
+        return self.x < other.right and other.x < self.right and self.y < other.bottom and other.y < self.bottom
+    
+    def contains(self, other: 'Rect') -> bool:
+        return (self.x <= other.x and self.y <= other.y
+                and other.right <= self.right and other.bottom <= self.bottom)
+
+
+class MaxRectsBin:
+    """MaxRects bin packer using the best short side fit heuristic, without rotation"""
+    
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.free_rects = [Rect(0, 0, width, height)]
+        self.used_rects: List[Rect] = []
+    
+    def insert(self, width: int, height: int) -> Optional[Rect]:
+        """Place a rectangle, returns its position or None when it does not fit"""
+        best = None
+        best_fit = (float('inf'), float('inf'))
+        for free in self.free_rects:
+            if free.width < width or free.height < height:
+                continue
+            leftover_x = free.width - width
+            leftover_y = free.height - height
+            fit = (min(leftover_x, leftover_y), max(leftover_x, leftover_y))
+            if fit < best_fit:
+                best = Rect(free.x, free.y, width, height)
+                best_fit = fit
+        
+        if best is None:
+            return None
+        self._split_free_rects(best)
+        self._prune_free_rects()
+        self.used_rects.append(best)
+        return best
+    
+    def _split_free_rects(self, used: Rect):
+        """Replace free rectangles overlapping the placed one with their maximal leftovers"""
+        free_rects = []
+        for free in self.free_rects:
+            if not free.intersects(used):
+                free_rects.append(free)
+                continue
+            if used.x > free.x:
+                free_rects.append(Rect(free.x, free.y, used.x - free.x, free.height))
+            if used.right < free.right:
+                free_rects.append(Rect(used.right, free.y, free.right - used.right, free.height))
+            if used.y > free.y:
+                free_rects.append(Rect(free.x, free.y, free.width, used.y - free.y))
+            if used.bottom < free.bottom:
+                free_rects.append(Rect(free.x, used.bottom, free.width, free.bottom - used.bottom))
+        self.free_rects = free_rects
+    
+    def _prune_free_rects(self):
+        """Drop free rectangles contained in another one"""
+        pruned = []
+        for index, rect in enumerate(self.free_rects):
+            contained = any(other.contains(rect) and (other != rect or other_index < index)
+                            for other_index, other in enumerate(self.free_rects) if other_index != index)
+            if not contained:
+                pruned.append(rect)
+        self.free_rects = pruned
+
+
+def _next_power_of_two(value: int) -> int:
+    return 1 << max(0, value - 1).bit_length()
+
+
+def _previous_power_of_two(value: int) -> int:
+    return 1 << (max(1, value).bit_length() - 1)
+
+
+def _pack_page(names: List[str], sizes: Dict[str, Tuple[int, int]], side: int) -> Dict[str, Rect]:
+    """Pack as many of the padded sprites as fit into one side x side bin"""
+    packer = MaxRectsBin(side, side)
+    placed = {}
+    for name in names:
+        rect = packer.insert(*sizes[name])
+        if rect:
+            placed[name] = rect
+    return placed
+
+
+def pack_sprites(sizes: Dict[str, Tuple[int, int]], max_size: int, padding: int
+                 ) -> List[Dict[str, Rect]]:
+    """Pack named sprite sizes into as few max_size bins as needed.
+    
+    Sprites are placed largest first. Each page starts from the smallest
+    square that could hold the remaining sprites and grows until they fit or
+    it reaches max_size, which keeps pages compact. Returns one placement
+    dict per atlas page, positions exclude the padding.
+    """
+    padded = {}
+    for name, (width, height) in sizes.items():
+        padded[name] = (width + 2 * padding, height + 2 * padding)
+        if max(padded[name]) > max_size:
+            raise ValueError(f"Sprite {name} ({width}x{height}) does not fit a {max_size}px atlas")
+    
+    remaining = sorted(padded, key=lambda name: (max(padded[name]), padded[name][0] * padded[name][1]), reverse=True)
+    pages: List[Dict[str, Rect]] = []
+    while remaining:
+        area = sum(padded[name][0] * padded[name][1] for name in remaining)
+        side = min(max_size, max(max(padded[remaining[0]]), math.ceil(math.sqrt(area))))
+        while True:
+            placed = _pack_page(remaining, padded, side)
+            if len(placed) == len(remaining) or side == max_size:
+                break
+            side = min(max_size, math.ceil(side * 1.05))
+        
+        pages.append({name: Rect(rect.x + padding, rect.y + padding, *sizes[name]) for name, rect in placed.items()})
+        remaining = [name for name in remaining if name not in placed]
+    return pages
+
+
+def _scaled_sprite(image: Image.Image, target: int) -> Image.Image:
+    """Scale so the longest side is target pixels, keeping the cropped aspect ratio"""
+    scale = target / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def _plist_index(index: Dict[str, Any]) -> bytes:
+    """Render an index as a plist in the frames/metadata layout used by sprite sheet tools"""
+    frames = {}
+    for name, frame in index['frames'].items():
+        frames[name] = {
+            'frame': f"{{{{{frame['x']},{frame['y']}}},{{{frame['width']},{frame['height']}}}}}",
+            'offset': '{0,0}',
+            'rotated': False,
+            'sourceSize': f"{{{frame['width']},{frame['height']}}}",
+            'textureFileName': index['atlases'][frame['atlas']]['file']
+        }
+    return plistlib.dumps({
+        'frames': frames,
+        'metadata': {
+            'format': 2,
+            'scale': index['scale'],
+            'textureFileNames': [atlas['file'] for atlas in index['atlases']]
+        }
+    })
+
+
+def build_atlases(icon_paths: Dict[str, str], output_dir: str, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Pack processed icons into atlases for every scale and write their indexes.
+    
+    icon_paths maps icon names to processed (already cropped) PNGs. Settings:
+    name, scales, base_size, max_size, padding, power_of_two, formats and
+    png_profile. Returns a report of written files and packing efficiency.
+    """
+    start_time = time.time()
+    output_path = Path(output_dir)
+    name = settings.get('name', 'icons')
+    padding = settings.get('padding', 2)
+    max_size = settings.get('max_size', 2048)
+    formats = settings.get('formats', ['json'])
+    if settings.get('power_of_two', False):
+        # Pages are rounded up after packing, so pack within a power of two that max_size allows
+        max_size = _previous_power_of_two(max_size)
+    
+    sources = {}
+    for icon_name, path in icon_paths.items():
+        with Image.open(path) as image:
+            sources[icon_name] = image.convert('RGBA')
+    
+    report = {'icons': len(sources), 'densities': {}}
+    for scale in settings.get('scales', [1, 2, 3]):
+        density = f"{scale:g}x"
+        sprites = {icon_name: _scaled_sprite(image, round(settings.get('base_size', 32) * scale))
+                   for icon_name, image in sources.items()}
+        pages = pack_sprites({icon_name: sprite.size for icon_name, sprite in sprites.items()}, max_size, padding)
+        
+        index = {'version': 1, 'name': name, 'density': density, 'scale': scale, 'atlases': [], 'frames': {}}
+        files = []
+        sprite_area = 0
+        atlas_area = 0
+        for page_number, page in enumerate(pages):
+            width = max(rect.right for rect in page.values()) + padding
+            height = max(rect.bottom for rect in page.values()) + padding
+            if settings.get('power_of_two', False):
+                width, height = _next_power_of_two(width), _next_power_of_two(height)
+            
+            atlas = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+            for icon_name, rect in page.items():
+                atlas.paste(sprites[icon_name], (rect.x, rect.y))
+                index['frames'][icon_name] = {'atlas': page_number, 'x': rect.x, 'y': rect.y,
+                                              'width': rect.width, 'height': rect.height}
+                sprite_area += rect.width * rect.height
+            atlas_area += width * height
+            
+            atlas_file = f"{name}@{density}_{page_number}.png"
+            generator._atomic_write(output_path / atlas_file,
+                                    generator._encode_with_profile(atlas, settings.get('png_profile', 'png'), settings))
+            index['atlases'].append({'file': atlas_file, 'width': width, 'height': height})
+            files.append(atlas_file)
+        
+        # Drop pages left over from an earlier run that needed more of them
+        for stale_page in output_path.glob(f"{name}@{density}_*.png"):
+            if stale_page.name not in files:
+                stale_page.unlink()
+        
+        if 'json' in formats:
+            generator._atomic_write(output_path / f"{name}@{density}.json", json.dumps(index, indent=2).encode('utf-8'))
+            files.append(f"{name}@{density}.json")
+        if 'plist' in formats:
+            generator._atomic_write(output_path / f"{name}@{density}.plist", _plist_index(index))
+            files.append(f"{name}@{density}.plist")
+        
+        report['densities'][density] = {
+            'pages': len(pages),
+            'files': files,
+            'fill_ratio': sprite_area / atlas_area if atlas_area else 0.0
+        }
+    
+    report['packing_time'] = time.time() - start_time
+    logger.info(f"🧩 Packed {len(sources)} icons into atlases for "
+                f"{', '.join(report['densities'])} in {report['packing_time']:.2f}s")
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Pack processed icons into texture atlases")
+    parser.add_argument('icons', nargs='+', help="Processed icon PNGs, the file stem is the sprite name")
+    parser.add_argument('--output', default='atlases', help="Directory for atlases and indexes")
+    parser.add_argument('--name', default='icons', help="Atlas file name prefix")
+    parser.add_argument('--scales', nargs='+', type=float, default=[1, 2, 3], help="Densities to pack")
+    parser.add_argument('--base-size', type=int, default=32, help="Longest icon side at 1x in pixels")
+    parser.add_argument('--max-size', type=int, default=2048, help="Maximum atlas width and height")
+    parser.add_argument('--padding', type=int, default=2, help="Transparent pixels around each sprite")
+    parser.add_argument('--power-of-two', action='store_true', help="Round atlas sizes up to powers of two")
+    parser.add_argument('--formats', nargs='+', choices=['json', 'plist'], default=['json'], help="Index formats")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    icon_paths = {Path(path).stem: path for path in args.icons if not path.endswith('_original.png')}
+    settings = {
+        'name': args.name,
+        'scales': [int(scale) if scale.is_integer() else scale for scale in args.scales],
+        'base_size': args.base_size,
+        'max_size': args.max_size,
+        'padding': args.padding,
+        'power_of_two': args.power_of_two,
+        'formats': args.formats
+    }
+    try:
+        report = build_atlases(icon_paths, args.output, settings)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Atlas packing failed: {e}")
+        return 1
+    
+    for density, stats in report['densities'].items():
+        print(f"{density}: {stats['pages']} page(s), {stats['fill_ratio'] * 100:.0f}% filled")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+⏱️ Icon Post-Processing Benchmark
+Measures background removal, crop, resize and transparency analysis over a
+synthetic corpus and compares results against a saved baseline
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import resource
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any
+
+import numpy as np
+from PIL import Image
+
+import icon_generator_v2 as generator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = [256, 512, 1024, 2048]
+
+# Alpha patterns of the corpus: flat background (what the API returns),
+# hard-edged cut-out, feathered cut-out and a speckled alpha channel
+ALPHA_PATTERNS = ['opaque', 'binary', 'soft', 'noisy']
+
+# Where the content sits in the frame, affects crop bounds and padding
+CONTENT_POSITIONS = ['center', 'corner', 'edge']
+
+STAGES = ['decode', 'background_removal', 'crop', 'resize', 'analysis', 'encode']
+
+# Version of the results format, and the version in which a stage started
+# measuring something different (decode only parsed headers before 2)
+RESULTS_VERSION = 2
+STAGE_MEASURED_SINCE = {'decode': 2}
+
+
+def make_sample(size: int, alpha_pattern: str, position: str, seed: int = 0) -> Image.Image:
+    """Build one deterministic RGBA test image"""
+    rng = np.random.default_rng(seed)
+    
+    # Content disc about a third of the frame
+    radius = size / 6
+    centers = {
+        'center': (size / 2, size / 2),
+        'corner': (radius * 1.2, radius * 1.2),
+        'edge': (size / 2, size - radius * 0.6)
+    }
+    center_x, center_y = centers[position]
+    y, x = np.mgrid[0:size, 0:size]
+    distance = np.hypot(x - center_x, y - center_y)
+    
+    rgb = np.empty((size, size, 3), dtype=np.uint8)
+    rgb[...] = (240, 240, 240)
+    inside = distance <= radius
+    rgb[inside] = rng.integers(0, 200, size=3, dtype=np.uint8)
+    
+    if alpha_pattern == 'opaque':
+        alpha = np.full((size, size), 255, dtype=np.uint8)
+    elif alpha_pattern == 'binary':
+        alpha = np.where(inside, 255, 0).astype(np.uint8)
+    elif alpha_pattern == 'soft':
+        feather = max(2.0, size / 64)
+        alpha = (np.clip((radius + feather - distance) / (2 * feather), 0, 1) * 255).astype(np.uint8)
+    elif alpha_pattern == 'noisy':
+        alpha = np.where(inside, 255, 0).astype(np.uint8)
+        speckle = rng.random((size, size)) < 0.02
+        alpha[speckle] = rng.integers(1, 255, size=int(speckle.sum()), dtype=np.uint8)
+    else:
+        raise ValueError(f"Unknown alpha pattern: {alpha_pattern}")
+    
+    return Image.fromarray(np.dstack([rgb, alpha]), 'RGBA')
+
+
+def build_corpus(sizes: List[int]) -> List[Dict[str, Any]]:
+    """Build every size, alpha pattern and content position combination"""
+    corpus = []
+    for size in sizes:
+        for alpha_pattern in ALPHA_PATTERNS:
+            for position in CONTENT_POSITIONS:
+                corpus.append({
+                    'size': size,
+                    'alpha_pattern': alpha_pattern,
+                    'position': position,
+                    'image': make_sample(size, alpha_pattern, position, seed=size)
+                })
+    return corpus
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _remove_background(image: Image.Image, rembg_model: str) -> Image.Image:
+    """rembg without the generator's fallback to the input image, so failures reach the benchmark"""
+    from rembg import remove
+    return remove(image, session=generator._get_rembg_session(rembg_model))
+
+
+class _ErrorRecorder(logging.Handler):
+    """Collects the errors stages log, the generator's stages log failures and return their input"""
+    
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages: List[str] = []
+    
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+
+def _checked(run, errors: _ErrorRecorder):
+    """Wrap a stage so a logged failure raises instead of being timed as a fast success"""
+    def checked_run(image, encoded):
+        result = run(image, encoded)
+        if errors.messages:
+            raise RuntimeError(errors.messages[0])
+        return result
+    return checked_run
+
+
+def _stage_callable(stage: str, rembg_model: str):
+    """Return a function running one stage on a corpus image"""
+    if stage == 'decode':
+        return lambda image, encoded: generator.ImagePipeline.decode(encoded)
+    if stage == 'background_removal':
+        return lambda image, encoded: _remove_background(image, rembg_model)
+    if stage == 'crop':
+        return lambda image, encoded: generator._crop_to_content(image, {})
+    if stage == 'resize':
+        return lambda image, encoded: generator._resize_to_standard_sizes(image, 'benchmark')
+    if stage == 'analysis':
+        return lambda image, encoded: generator._analyze_transparency_quality(image, 'benchmark')
+    if stage == 'encode':
+        return lambda image, encoded: generator.ImagePipeline.encode(image)
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def run_stage(stage: str, sizes: List[int], repeat: int, rembg_model: str) -> Dict[str, Any]:
+    """Benchmark one stage, meant to run in a fresh process so peak RSS is per stage"""
+    generator_logger = logging.getLogger(generator.__name__)
+    generator_logger.setLevel(logging.WARNING)
+    errors = _ErrorRecorder()
+    generator_logger.addHandler(errors)
+    
+    corpus = build_corpus(sizes)
+    encoded = [generator.ImagePipeline.encode(sample['image']) for sample in corpus]
+    run = _checked(_stage_callable(stage, rembg_model), errors)
+    
+    # Warm up outside the measurement, this loads the rembg model once
+    run(corpus[0]['image'], encoded[0])
+    baseline_rss = _peak_rss_mb()
+    
+    latencies = []
+    megapixels = []
+    for _ in range(repeat):
+        for sample, data in zip(corpus, encoded):
+            start_time = time.perf_counter()
+            run(sample['image'], data)
+            latencies.append(time.perf_counter() - start_time)
+            megapixels.append(sample['size'] * sample['size'] / 1_000_000)
+    
+    latencies_ms = np.array(latencies) * 1000
+    per_megapixel_ms = latencies_ms / np.array(megapixels)
+    peak_rss = _peak_rss_mb()
+    
+    return {
+        'samples': len(latencies),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms_per_megapixel': float(np.percentile(per_megapixel_ms, 50)),
+        'p95_ms_per_megapixel': float(np.percentile(per_megapixel_ms, 95)),
+        'megapixels_per_second': float(sum(megapixels) / sum(latencies)),
+        'images_per_second': float(len(latencies) / sum(latencies)),
+        'peak_rss_mb': peak_rss,
+        'rss_growth_mb': peak_rss - baseline_rss,
+        'by_size': {
+            str(size): float(np.percentile([latency for latency, sample in zip(latencies_ms, corpus * repeat)
+                                            if sample['size'] == size], 50))
+            for size in sizes
+        }
+    }
+
+
+def run_benchmark(stages: List[str], sizes: List[int], repeat: int, rembg_model: str) -> Dict[str, Any]:
+    """Run every stage in its own spawned process and collect results"""
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for stage in stages:
+        print(f"⏱️ Benchmarking {stage}...", flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                results[stage] = executor.submit(run_stage, stage, sizes, repeat, rembg_model).result()
+            except Exception as e:
+                logger.error(f"❌ Stage {stage} failed: {e}")
+                results[stage] = {'error': str(e)}
+    
+    return {
+        'version': RESULTS_VERSION,
+        'timestamp': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pillow': Image.__version__,
+            'numpy': np.__version__
+        },
+        'config': {
+            'sizes': sizes,
+            'alpha_patterns': ALPHA_PATTERNS,
+            'positions': CONTENT_POSITIONS,
+            'repeat': repeat,
+            'rembg_model': rembg_model
+        },
+        'stages': results
+    }
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Compare per-megapixel latency against a baseline, returns regressions"""
+    regressions = []
+    baseline_version = baseline.get('version', 1)
+    for stage, current in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous or 'error' in current or 'error' in previous:
+            continue
+        if baseline_version < STAGE_MEASURED_SINCE.get(stage, 1):
+            logger.warning(f"Skipping {stage}: the baseline measured it differently, save a new baseline")
+            continue
+        for metric in ('p50_ms_per_megapixel', 'p95_ms_per_megapixel'):
+            if previous.get(metric, 0) <= 0:
+                continue
+            change = current[metric] / previous[metric] - 1
+            current.setdefault('change_vs_baseline', {})[metric] = change
+            if change > threshold:
+                regressions.append({
+                    'stage': stage,
+                    'metric': metric,
+                    'baseline': previous[metric],
+                    'current': current[metric],
+                    'change': change
+                })
+    return regressions
+
+
+def print_results(results: Dict[str, Any]):
+    """Print a summary table"""
+    print(f"\n{'stage':<20}{'p50 ms':>10}{'p95 ms':>10}{'ms/MP':>10}{'MP/s':>10}{'peak MB':>10}{'Δ':>9}")
+    for stage, stats in results['stages'].items():
+        if 'error' in stats:
+            print(f"{stage:<20}  failed: {stats['error']}")
+            continue
+        change = stats.get('change_vs_baseline', {}).get('p50_ms_per_megapixel')
+        change_text = f"{change * 100:+.1f}%" if change is not None else ''
+        print(f"{stage:<20}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+              f"{stats['p50_ms_per_megapixel']:>10.1f}{stats['megapixels_per_second']:>10.1f}"
+              f"{stats['peak_rss_mb']:>10.0f}{change_text:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark icon post-processing stages")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="Stages to benchmark")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="Square image sizes in pixels")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the corpus per stage")
+    parser.add_argument('--rembg-model', default='u2net', help="rembg model for background removal")
+    parser.add_argument('--output', default=f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                        help="Where to write JSON results")
+    parser.add_argument('--baseline', help="Previous results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help="Relative slowdown in per-megapixel latency flagged as a regression")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    results = run_benchmark(args.stages, args.sizes, args.repeat, args.rembg_model)
+    
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        results['baseline'] = {'path': args.baseline, 'threshold': args.threshold, 'regressions': regressions}
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    
+    print_results(results)
+    print(f"\n📄 Results saved: {args.output}")
+    
+    failed_stages = [stage for stage, stats in results['stages'].items() if 'error' in stats]
+    if failed_stages:
+        print(f"\n❌ {len(failed_stages)} stage(s) failed: {', '.join(failed_stages)}")
+        return 1
+    
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} regression(s) over {args.threshold * 100:.0f}%:")
+        for regression in regressions:
+            print(f"   • {regression['stage']} {regression['metric']}: "
+                  f"{regression['baseline']:.1f} → {regression['current']:.1f} ({regression['change'] * 100:+.1f}%)")
+        return 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
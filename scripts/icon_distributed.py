@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+🌐 Distributed Icon Generation
+Coordinator/worker mode for catalog-wide runs. The coordinator shards a
+configuration into one queued task per icon, workers in any number of
+processes or hosts lease tasks from the shared SQLite queue, and the
+coordinator merges their results into one generation report
+"""
+
+import os
+import sys
+import json
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import icon_generator_v2 as generator
+from icon_service import IconService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_DIR = '.icon_distributed'
+
+
+def shard_config(service: IconService, config_file: str, incremental: bool = False, cache_mode: str = 'use',
+                 backend: Optional[str] = None) -> Optional[str]:
+    """Queue one task per icon of a configuration, returns the job id or None when nothing is stale.
+    
+    The output directory is resolved here, so every worker writes to the
+    same place. It has to be reachable under that path on every host. The
+    coordinator submits its own configuration, so that directory becomes
+    the service's output root.
+    """
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    output = config.get('generation', {}).get('output', {})
+    output['directory'] = str(Path(output.get('directory', './generated-icons')).resolve())
+    service.output_root = Path(output['directory'])
+    
+    icons = None
+    if incremental:
+        # Fingerprints need the configured model, so this uses the same backend as the workers
+        planner = generator.ConfigurableIconGenerator(config_file, incremental=True, backend=backend)
+        try:
+            icons = [icon_config.name for icon_config in planner.changed_icons()]
+        finally:
+            planner.close()
+        logger.info(f"📋 {len(icons)} of {len(planner.icon_configs)} icons changed since the last build")
+        if not icons:
+            return None
+    
+    job = service.submit({'config': config, 'icons': icons, 'cache_mode': cache_mode, 'incremental': incremental})
+    return job['id']
+
+
+def spawn_local_workers(args, count: int) -> List[subprocess.Popen]:
+    """Start worker processes on this host against the coordinator's queue"""
+    command = [sys.executable, str(Path(__file__).resolve()), 'worker', '--queue', args.queue,
+               '--max-tasks', str(args.max_tasks), '--lease-seconds', str(args.lease_seconds),
+               '--journal-mode', args.journal_mode]
+    if args.backend:
+        command += ['--backend', args.backend]
+    return [subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for _ in range(count)]
+
+
+async def wait_for_job(service: IconService, job_id: str, interval: float) -> Dict[str, int]:
+    """Poll until no task of the job is open, requeueing tasks of workers that stopped renewing"""
+    last_counts = None
+    while True:
+        service.queue.requeue_expired()
+        counts = service.queue.counts(job_id)
+        if counts != last_counts:
+            total = sum(counts.values())
+            logger.info(f"📊 {counts['done'] + counts['failed']}/{total} icons finished "
+                        f"({counts['running']} running, {counts['failed']} failed)")
+            last_counts = counts
+        if not counts['pending'] and not counts['running']:
+            return counts
+        await asyncio.sleep(interval)
+
+
+def _print_report(report_path: str):
+    with open(report_path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    summary = report['summary']
+    print(f"✅ {summary['successful']}/{summary['total_icons']} icons generated, report: {report_path}")
+    for worker_id, stats in sorted(report.get('workers', {}).items()):
+        print(f"   • {worker_id}: {stats['icons']} icons, {stats['failed']} failed, "
+              f"{stats['retried']} retried, {stats['busy_time']:.1f}s busy")
+    for failed in report['failed_icons']:
+        print(f"   ❌ {failed['name']}: {failed['error']}")
+
+
+async def coordinate(args) -> int:
+    """Shard a configuration, wait for the workers and merge their results"""
+    service = IconService(args.queue, worker_id=f"coordinator@{socket.gethostname()}", backend=args.backend,
+                          lease_seconds=args.lease_seconds, finish_jobs=False, journal_mode=args.journal_mode)
+    workers: List[subprocess.Popen] = []
+    try:
+        if args.job:
+            job_id = args.job
+            if service.queue.job(job_id) is None:
+                logger.error(f"❌ Unknown job: {job_id}")
+                return 1
+        else:
+            job_id = shard_config(service, args.config_file, args.incremental, args.cache_mode, args.backend)
+            if job_id is None:
+                print("✅ All icons are up to date")
+                return 0
+        logger.info(f"🌐 Job {job_id} queued in {args.queue}, waiting for workers")
+        
+        workers = spawn_local_workers(args, args.local_workers)
+        counts = await wait_for_job(service, job_id, args.interval)
+        report = await service.finish_job(job_id)
+        if 'error' in report:
+            logger.error(f"❌ Could not merge results: {report['error']}")
+            return 1
+        _print_report(report['report_path'])
+        return 0 if not counts['failed'] else 1
+    finally:
+        # Interrupted workers hand their leases back to the queue
+        for process in workers:
+            if process.poll() is None:
+                process.send_signal(signal.SIGINT)
+        for process in workers:
+            process.wait()
+        await service.aclose()
+
+
+async def work(args) -> int:
+    """Generate queued icons until the queue is drained, or until interrupted with --wait"""
+    worker_id = args.worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    service = IconService(args.queue, worker_id=worker_id, backend=args.backend, max_tasks=args.max_tasks,
+                          lease_seconds=args.lease_seconds, finish_jobs=False, journal_mode=args.journal_mode)
+    logger.info(f"🛠️ Worker {worker_id} polling {args.queue}")
+    try:
+        await service.run(exit_when_idle=not args.wait)
+    finally:
+        await service.aclose()
+    return 0
+
+
+def main() -> int:
+    queue_parser = argparse.ArgumentParser(add_help=False)
+    queue_parser.add_argument('--queue', default=DEFAULT_QUEUE_DIR,
+                              help="Queue directory, on storage shared by every host")
+    queue_parser.add_argument('--backend', choices=['gemini', 'synthetic'], help="Override ai_settings.backend")
+    queue_parser.add_argument('--max-tasks', type=int, default=8, help="Icons in flight per worker")
+    queue_parser.add_argument('--lease-seconds', type=float, default=60.0,
+                              help="Time after which icons of a silent worker are handed to another one")
+    queue_parser.add_argument('--journal-mode', choices=['DELETE', 'WAL'], default='DELETE',
+                              help="SQLite journal mode, WAL only works when all processes are on one host")
+    
+    parser = argparse.ArgumentParser(description="Distributed icon generation across worker processes and hosts")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    coordinate_parser = commands.add_parser('coordinate', parents=[queue_parser],
+                                            help="Shard a configuration and merge the workers' results")
+    coordinate_parser.add_argument('config_file', nargs='?', help="Path to icon configuration JSON file")
+    coordinate_parser.add_argument('--job', help="Wait for and merge an already queued job instead")
+    coordinate_parser.add_argument('--local-workers', type=int, default=0, help="Worker processes to start on this host")
+    coordinate_parser.add_argument('--incremental', action='store_true', help="Only queue icons that changed")
+    cache_group = coordinate_parser.add_mutually_exclusive_group()
+    cache_group.add_argument('--no-cache', dest='cache_mode', action='store_const', const='bypass', default='use',
+                             help="Bypass the response cache")
+    cache_group.add_argument('--refresh-cache', dest='cache_mode', action='store_const', const='refresh',
+                             help="Ignore cached responses but store new ones")
+    coordinate_parser.add_argument('--interval', type=float, default=2.0, help="Seconds between progress checks")
+    
+    worker_parser = commands.add_parser('worker', parents=[queue_parser], help="Generate icons from the queue")
+    worker_parser.add_argument('--worker-id', help="Lease owner name, keep it stable across restarts")
+    worker_parser.add_argument('--wait', action='store_true', help="Keep polling for new jobs once the queue is drained")
+    
+    args = parser.parse_args()
+    if args.command == 'coordinate' and not (args.config_file or args.job):
+        parser.error("coordinate needs a configuration file or --job")
+    
+    Path(args.queue).mkdir(parents=True, exist_ok=True)
+    log_name = 'coordinator.log' if args.command == 'coordinate' else f"worker-{os.getpid()}.log"
+    generator.configure_logging(log_file=str(Path(args.queue) / log_name))
+    
+    try:
+        if args.command == 'coordinate':
+            if args.config_file and generator.validate_configs([args.config_file]):
+                return 1
+            return asyncio.run(coordinate(args))
+        return asyncio.run(work(args))
+    except KeyboardInterrupt:
+        return 0
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    exit(main())
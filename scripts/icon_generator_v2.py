@@ -4,41 +4,63 @@
 Advanced AI-powered icon generation with flexible JSON configuration
 """
 
+from __future__ import annotations
+
 import os
+import sys
 import json
 import asyncio
 import logging
 import time
+import random
+import hashlib
+import math
+import threading
+import importlib
+import itertools
+import sqlite3
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
-from dataclasses import dataclass, asdict
-import jsonschema
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Union
+from dataclasses import dataclass, asdict, field
+from contextlib import contextmanager
+from functools import partial
 import re
+from abc import ABC, abstractmethod
 
 # Third-party imports
-from google import genai
-from google.genai import types
-from PIL import Image
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
 import base64
-from rembg import remove
 
 # Load environment variables from scripts directory
 load_dotenv(dotenv_path='.env')
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('icon_generation.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+
+class _LazyModule:
+    """Stand-in that imports a module on first attribute access.
+    
+    Heavy dependencies are only loaded once a stage actually uses them, so
+    commands like `validate` start without paying for them. google.genai,
+    jsonschema and rembg are imported inside the functions that need them.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+    
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(importlib.import_module(self._name), attr)
+
+
+Image = _LazyModule('PIL.Image')
+np = _LazyModule('numpy')
+
+DEFAULT_SCHEMA_PATH = Path(__file__).with_name('icon-config.schema.json')
+
 @dataclass
 class IconConfig:
     """Data class for individual icon configuration"""
@@ -74,19 +96,28 @@ class IconResult:
     generation_time: float
     success: bool = True
     error: Optional[str] = None
+    spans: List[Dict[str, Any]] = field(default_factory=list)
 
 class ConfigLoader:
     """Handles loading and validation of JSON configuration files"""
     
-    def __init__(self, schema_path: str = "icon-config.schema.json"):
-        self.schema_path = schema_path
+    # Parsed schemas and their validators by schema path and mtime, shared by every loader in the process
+    _schemas: Dict[tuple, Dict[str, Any]] = {}
+    _validators: Dict[tuple, Any] = {}
+    
+    def __init__(self, schema_path: Optional[str] = None):
+        self.schema_path = schema_path or DEFAULT_SCHEMA_PATH
         self.schema = self._load_schema()
     
     def _load_schema(self) -> Dict[str, Any]:
-        """Load JSON schema for validation"""
+        """Load JSON schema for validation, parsed once per process unless the file changes"""
         try:
-            with open(self.schema_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            schema_path = Path(self.schema_path).resolve()
+            self._schema_key = (str(schema_path), schema_path.stat().st_mtime_ns)
+            if self._schema_key not in self._schemas:
+                with open(schema_path, 'r', encoding='utf-8') as f:
+                    self._schemas[self._schema_key] = json.load(f)
+            return self._schemas[self._schema_key]
         except FileNotFoundError:
             logger.warning(f"Schema file {self.schema_path} not found. Skipping validation.")
             return {}
@@ -101,13 +132,12 @@ class ConfigLoader:
                 config = json.load(f)
             
             # Validate against schema if available
+            errors = self.validation_errors(config)
+            if errors:
+                logger.error(f"Configuration validation failed: {errors[0]}")
+                raise ValueError(f"Invalid configuration: {errors[0]}")
             if self.schema:
-                try:
-                    jsonschema.validate(config, self.schema)
-                    logger.info("Configuration validation passed")
-                except jsonschema.ValidationError as e:
-                    logger.error(f"Configuration validation failed: {e.message}")
-                    raise ValueError(f"Invalid configuration: {e.message}")
+                logger.info("Configuration validation passed")
             
             return config
         
@@ -116,6 +146,36 @@ class ConfigLoader:
         except json.JSONDecodeError as e:
             raise ValueError(f"Invalid JSON in configuration file: {e}")
     
+    def validation_errors(self, config: Dict[str, Any]) -> List[str]:
+        """All schema violations of a configuration, prefixed with their JSON path"""
+        if not self.schema:
+            return []
+        validator = self._validators.get(self._schema_key)
+        if validator is None:
+            import jsonschema
+            validator = self._validators[self._schema_key] = jsonschema.Draft7Validator(self.schema)
+        return [f"{'/'.join(str(part) for part in error.absolute_path) or '<root>'}: {error.message}"
+                for error in sorted(validator.iter_errors(config), key=lambda error: list(error.absolute_path))]
+    
+    def check_config(self, config_data: Dict[str, Any]) -> List[str]:
+        """Problems the schema cannot express: duplicate icon names and unresolved prompt placeholders"""
+        project_config, icon_configs, generation_config = self.parse_config(config_data)
+        problems = []
+        
+        seen = set()
+        for icon_config in icon_configs:
+            if icon_config.name in seen:
+                problems.append(f"icons: duplicate icon name '{icon_config.name}'")
+            seen.add(icon_config.name)
+        
+        prompt_builder = PromptBuilder(project_config, generation_config)
+        for icon_config in icon_configs:
+            unresolved = sorted(set(re.findall(r'\{(\w+)\}', prompt_builder.build(icon_config))))
+            if unresolved:
+                problems.append(f"icons/{icon_config.name}: unresolved prompt placeholders "
+                                f"{', '.join(unresolved)}")
+        return problems
+    
     def parse_config(self, config_data: Dict[str, Any]) -> tuple[ProjectConfig, List[IconConfig], GenerationConfig]:
         """Parse configuration data into structured objects"""
         
@@ -174,254 +234,21 @@ class PromptTemplate:
             logger.error(f"Error processing template: {e}")
             return template
 
-class ConfigurableIconGenerator:
-    """Main icon generator class that uses JSON configuration"""
-    
-    def __init__(self, config_path: str):
-        self.config_loader = ConfigLoader()
-        self.config_data = self.config_loader.load_config(config_path)
-        self.project_config, self.icon_configs, self.generation_config = self.config_loader.parse_config(self.config_data)
-        
-        # Initialize AI clients
-        self._setup_ai_clients()
-        
-        # Setup output directory
-        self._setup_output_directory()
-        
-        logger.info(f"Initialized generator for project: {self.project_config.name}")
-        logger.info(f"Loaded {len(self.icon_configs)} icon configurations")
-    
-    def _setup_ai_clients(self):
-        """Setup AI clients with API keys"""
-        api_key = os.getenv('GOOGLE_API_KEY')
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY environment variable is required")
-        
-        # Configure Gemini client
-        self.client = genai.Client(api_key=api_key)
-        
-        # Set default model for image generation
-        self.image_model = self.generation_config.ai_settings.get('image_model', 'gemini-2.5-flash-image-preview')
-        
-        logger.info(f"Initialized Gemini client with model: {self.image_model}")
-    
-    def _setup_output_directory(self):
-        """Setup output directory from configuration"""
-        output_dir = self.generation_config.output.get('directory', './generated-icons')
-        self.output_path = Path(output_dir)
-        self.output_path.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Output directory: {self.output_path}")
-    
-    def _remove_background_with_rembg(self, image_data: bytes) -> bytes:
-        """Remove background using rembg library"""
-        try:
-            logger.info("🎨 Removing background with rembg...")
-            start_time = time.time()
-            
-            # Apply rembg to remove background
-            processed_data = remove(image_data)
-            
-            processing_time = time.time() - start_time
-            logger.info(f"✅ Background removed successfully in {processing_time:.2f}s")
-            
-            return processed_data
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to remove background with rembg: {e}")
-            # Return original data if rembg fails
-            return image_data
-    
-    def _crop_to_content(self, image_data: bytes) -> bytes:
-        """Crop image to content with configurable aspect ratio and smart padding"""
-        # Get crop config from generation config
-        crop_config = self.generation_config.output.get('crop', {})
-        
-        # Default values
-        enabled = crop_config.get('enabled', True)
-        aspect_ratio = crop_config.get('aspect_ratio', 'square')
-        padding_percentage = crop_config.get('padding_percentage', 15) / 100.0
-        min_padding = crop_config.get('min_padding_px', 10)
-        
-        if not enabled:
-            logger.info("🚫 Cropping disabled in config")
-            return image_data
-        
-        try:
-            logger.info(f"✂️ Cropping to content with {aspect_ratio} aspect ratio...")
-            start_time = time.time()
-            
-            # Load image
-            image = Image.open(BytesIO(image_data))
-            
-            # Convert to RGBA if not already
-            if image.mode != 'RGBA':
-                image = image.convert('RGBA')
-            
-            # Get the bounding box of non-transparent pixels
-            bbox = image.getbbox()
-            
-            if bbox:
-                left, top, right, bottom = bbox
-                content_width = right - left
-                content_height = bottom - top
-                
-                # Calculate padding
-                padding_x = max(min_padding, int(content_width * padding_percentage))
-                padding_y = max(min_padding, int(content_height * padding_percentage))
-                
-                # Add padding to content bounds
-                padded_left = max(0, left - padding_x)
-                padded_top = max(0, top - padding_y)
-                padded_right = min(image.width, right + padding_x)
-                padded_bottom = min(image.height, bottom + padding_y)
-                
-                # Calculate dimensions with padding
-                padded_width = padded_right - padded_left
-                padded_height = padded_bottom - padded_top
-                
-                # Apply aspect ratio
-                if aspect_ratio == 'square':
-                    # Make it square by using the larger dimension
-                    final_size = max(padded_width, padded_height)
-                    final_width = final_height = final_size
-                elif aspect_ratio == 'original':
-                    # Keep original proportions
-                    final_width = padded_width
-                    final_height = padded_height
-                else:
-                    # For future: support custom ratios like "16:9", "4:3", etc.
-                    final_width = padded_width
-                    final_height = padded_height
-                
-                # Calculate center point
-                center_x = (padded_left + padded_right) // 2
-                center_y = (padded_top + padded_bottom) // 2
-                
-                # Calculate crop bounds centered on content
-                half_width = final_width // 2
-                half_height = final_height // 2
-                crop_left = max(0, center_x - half_width)
-                crop_top = max(0, center_y - half_height)
-                crop_right = min(image.width, crop_left + final_width)
-                crop_bottom = min(image.height, crop_top + final_height)
-                
-                # Adjust if we hit image boundaries
-                if crop_right - crop_left < final_width:
-                    crop_left = max(0, crop_right - final_width)
-                if crop_bottom - crop_top < final_height:
-                    crop_top = max(0, crop_bottom - final_height)
-                
-                # Crop the image
-                cropped_image = image.crop((crop_left, crop_top, crop_right, crop_bottom))
-                
-                # If the cropped image is smaller than target size (due to image boundaries),
-                # create a new image and paste the cropped content in the center
-                if cropped_image.size != (final_width, final_height):
-                    target_image = Image.new('RGBA', (final_width, final_height), (0, 0, 0, 0))
-                    paste_x = (final_width - cropped_image.width) // 2
-                    paste_y = (final_height - cropped_image.height) // 2
-                    target_image.paste(cropped_image, (paste_x, paste_y))
-                    cropped_image = target_image
-                
-                # Save to bytes
-                output = BytesIO()
-                cropped_image.save(output, format='PNG')
-                cropped_data = output.getvalue()
-                
-                processing_time = time.time() - start_time
-                logger.info(f"✅ Cropped to {aspect_ratio} content in {processing_time:.2f}s")
-                logger.info(f"   • Original content: {content_width}x{content_height}")
-                logger.info(f"   • Final size: {cropped_image.size}")
-                logger.info(f"   • Padding: {padding_percentage*100:.0f}% ({padding_x}px x {padding_y}px)")
-                
-                return cropped_data
-            else:
-                logger.warning("⚠️ No content found to crop, returning original")
-                return image_data
-                
-        except Exception as e:
-            logger.error(f"❌ Failed to crop image: {e}")
-            return image_data
+class PromptBuilder:
+    """Builds generation prompts from the project, style and prompt settings"""
     
-    def _resize_to_standard_sizes(self, image_data: bytes, icon_name: str) -> Dict[str, bytes]:
-        """Resize icon to standard Android sizes"""
-        try:
-            logger.info("📐 Resizing to standard Android sizes...")
-            start_time = time.time()
-            
-            # Standard Android icon sizes
-            android_sizes = {
-                'mdpi': 48,      # 1x
-                'hdpi': 72,      # 1.5x
-                'xhdpi': 96,     # 2x
-                'xxhdpi': 144,   # 3x
-                'xxxhdpi': 192   # 4x
-            }
-            
-            # Load image
-            image = Image.open(BytesIO(image_data))
-            
-            # Convert to RGBA if not already
-            if image.mode != 'RGBA':
-                image = image.convert('RGBA')
-            
-            resized_images = {}
-            
-            for density, size in android_sizes.items():
-                # Resize with high quality
-                resized = image.resize((size, size), Image.Resampling.LANCZOS)
-                
-                # Save to bytes
-                output = BytesIO()
-                resized.save(output, format='PNG')
-                resized_images[density] = output.getvalue()
-                
-                logger.info(f"   • {density}: {size}x{size}px")
-            
-            processing_time = time.time() - start_time
-            logger.info(f"✅ Resized to {len(android_sizes)} standard sizes in {processing_time:.2f}s")
-            
-            return resized_images
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to resize image: {e}")
-            return {}
+    def __init__(self, project_config: ProjectConfig, generation_config: GenerationConfig):
+        self.project_config = project_config
+        self.generation_config = generation_config
     
-    def _analyze_transparency_quality(self, image_data: bytes, icon_name: str):
-        """Analyze transparency quality of processed image"""
-        try:
-            # Load image from bytes
-            image = Image.open(BytesIO(image_data))
-            
-            # Check if image has transparency
-            if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
-                # Count transparent pixels
-                if image.mode == 'RGBA':
-                    alpha_channel = image.split()[-1]
-                    transparent_pixels = sum(1 for pixel in alpha_channel.getdata() if pixel < 128)
-                    total_pixels = image.width * image.height
-                    transparency_percentage = (transparent_pixels / total_pixels) * 100
-                    
-                    logger.info(f"📊 Icon '{icon_name}' transparency analysis:")
-                    logger.info(f"   • Transparent pixels: {transparent_pixels:,} ({transparency_percentage:.1f}%)")
-                    logger.info(f"   • Image size: {image.width}x{image.height}")
-                    logger.info(f"   • Supports transparency: ✅")
-                    
-                    if transparency_percentage > 50:
-                        logger.info(f"   • Quality: 🎯 Excellent background removal!")
-                    elif transparency_percentage > 20:
-                        logger.info(f"   • Quality: ✅ Good background removal")
-                    else:
-                        logger.info(f"   • Quality: ⚠️ Limited background removal")
-                else:
-                    logger.info(f"📊 Icon '{icon_name}' has transparency support but not RGBA mode")
-            else:
-                logger.info(f"📊 Icon '{icon_name}' does not support transparency")
-                
-        except Exception as e:
-            logger.error(f"❌ Failed to analyze transparency for {icon_name}: {e}")
+    def effective_style(self, icon_config: IconConfig) -> Dict[str, Any]:
+        """Merge default style with icon-specific overrides"""
+        style = self.generation_config.style.copy()
+        if icon_config.style_overrides:
+            style.update(icon_config.style_overrides)
+        return style
     
-    def _create_generation_prompt(self, icon_config: IconConfig) -> str:
+    def build(self, icon_config: IconConfig) -> str:
         """Create generation prompt from template and icon config"""
         
         # Get base template
@@ -429,9 +256,7 @@ class ConfigurableIconGenerator:
             "Create a {complexity} {fill_style} icon for {description}. Style: {design_system} design with {color_scheme} colors.")
         
         # Merge default style with icon-specific overrides
-        style = self.generation_config.style.copy()
-        if icon_config.style_overrides:
-            style.update(icon_config.style_overrides)
+        style = self.effective_style(icon_config)
         
         # Prepare template variables
         template_vars = {
@@ -470,205 +295,2772 @@ class ConfigurableIconGenerator:
         prompt += "\n- Ensure good contrast and clarity for the icon design"
         
         return prompt
+
+    def subject_features(self, icon_config: IconConfig) -> List[str]:
+        """Words and word pairs describing what the icon shows, independent of the prompt template"""
+        text = ' '.join([icon_config.display_name, icon_config.description, *icon_config.keywords,
+                         (icon_config.style_overrides or {}).get('custom_prompt', '')])
+        words = re.findall(r'[a-z0-9]+', text.lower())
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+def _fingerprint(data: Any) -> str:
+    """Stable SHA-256 fingerprint of JSON-serializable data"""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _simhash(features: List[str]) -> int:
+    """64-bit Charikar simhash, similar feature sets give hashes a few bits apart"""
+    weights = [0] * 64
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def _hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def _is_quota_error(error: Exception) -> bool:
+    """Check whether an API error means the request quota was exceeded"""
+    if getattr(error, 'code', None) == 429:
+        return True
+    message = str(error)
+    return '429' in message or 'RESOURCE_EXHAUSTED' in message
+
+
+def _is_retryable_error(error: Exception) -> bool:
+    """Check whether an API error is transient and worth retrying"""
+    if _is_quota_error(error):
+        return True
+    if getattr(error, 'code', None) in (500, 502, 503, 504):
+        return True
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # httpx timeouts and dropped pooled connections, matched by name so httpx stays a lazy import
+    if any(cls.__name__ in ('TimeoutException', 'NetworkError', 'RemoteProtocolError') for cls in type(error).__mro__):
+        return True
+    message = str(error)
+    return 'UNAVAILABLE' in message or 'DEADLINE_EXCEEDED' in message
+
+
+class RateLimiter:
+    """Token-bucket rate limiter shared by all in-flight generations.
     
-    async def generate_single_icon(self, icon_config: IconConfig) -> IconResult:
-        """Generate a single icon using Gemini image generation API"""
-        start_time = time.time()
+    The refill rate is halved on every quota error and recovers gradually
+    towards the configured requests-per-minute on each successful call.
+    """
+    
+    def __init__(self, requests_per_minute: float = 20, burst: int = 4,
+                 min_requests_per_minute: float = 1):
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = min(min_requests_per_minute, requests_per_minute) / 60.0
+        self.rate = self.max_rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+    
+    @classmethod
+    def from_settings(cls, ai_settings: Dict[str, Any]) -> 'RateLimiter':
+        """Create rate limiter from ai_settings.rate_limit"""
+        rate_limit = ai_settings.get('rate_limit', {})
+        return cls(
+            requests_per_minute=rate_limit.get('requests_per_minute', 20),
+            burst=rate_limit.get('burst', 4),
+            min_requests_per_minute=rate_limit.get('min_requests_per_minute', 1)
+        )
+    
+    @property
+    def requests_per_minute(self) -> float:
+        return self.rate * 60.0
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    async def acquire(self) -> float:
+        """Wait for a request token, returns seconds spent waiting"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
         
-        try:
-            # Create generation prompt for image generation
-            prompt = self._create_generation_prompt(icon_config)
-            logger.info(f"Generating icon: {icon_config.name}")
-            logger.debug(f"Prompt: {prompt}")
-            
-            # Generate image using Gemini generate_content API
-            response = await asyncio.to_thread(
-                self.client.models.generate_content,
-                model=self.image_model,
-                contents=[prompt]
-            )
-            
-            # Parse response to get image data
-            image_data = None
-            for part in response.candidates[0].content.parts:
-                if part.inline_data is not None:
-                    image_data = part.inline_data.data
+        start_time = time.monotonic()
+        # Waiters queue on the lock so tokens are handed out in FIFO order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
                     break
-            
-            if image_data is None:
-                raise ValueError("No image data found in response")
-            
-            # Calculate generation time
-            generation_time = time.time() - start_time
-            
-            # Create result with PNG data only
-            result = IconResult(
-                name=icon_config.name,
-                metadata={
-                    'display_name': icon_config.display_name,
-                    'description': icon_config.description,
-                    'category': icon_config.category,
-                    'keywords': icon_config.keywords,
-                    'style': self.generation_config.style,
-                    'generation_time': generation_time,
-                    'model_used': self.image_model,
-                    'prompt': prompt,
-                    'format': 'PNG',
-                    'generation_method': 'gemini_generate_content_api',
-                    'timestamp': datetime.now().isoformat(),
-                    'image_data': image_data  # Store PNG data for saving
-                },
-                generation_time=generation_time
-            )
-            
-            # Save icon
-            await self._save_icon(result)
-            
-            logger.info(f"Successfully generated PNG icon: {icon_config.name} ({generation_time:.2f}s)")
-            return result
-            
-        except Exception as e:
-            generation_time = time.time() - start_time
-            error_msg = f"Failed to generate icon {icon_config.name}: {str(e)}"
-            logger.error(error_msg)
-            
-            return IconResult(
-                name=icon_config.name,
-                metadata={
-                    'display_name': icon_config.display_name,
-                    'description': icon_config.description,
-                    'category': icon_config.category,
-                    'keywords': icon_config.keywords,
-                    'error': error_msg,
-                    'generation_method': 'gemini_generate_content_api'
-                },
-                generation_time=generation_time,
-                success=False,
-                error=error_msg
-            )
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        
+        return time.monotonic() - start_time
+    
+    def try_acquire(self) -> bool:
+        """Take a token only if one is free right now and nobody is queued for it"""
+        if self._lock is not None and self._lock.locked():
+            return False
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+    
+    def on_success(self):
+        """Recover rate additively after a successful request"""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
     
+    def on_quota_error(self):
+        """Back off multiplicatively after a quota error"""
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+        logger.warning(f"⏳ Quota exceeded, slowing down to {self.requests_per_minute:.1f} requests/min")
 
+
+class RequestHedger:
+    """Decides when a slow API call gets a duplicate (hedged) request.
     
-    async def _save_icon(self, result: IconResult):
-        """Save generated PNG icon to file (NO SVG)"""
-        try:
-            # Get filename pattern
-            filename_pattern = self.generation_config.output.get('filename_pattern', '{name}')
-            filename = PromptTemplate.process_template(filename_pattern, 
-                                                     name=result.name, 
-                                                     timestamp=datetime.now().strftime('%Y%m%d_%H%M%S'))
-            
-            # Save PNG file ONLY
-            png_path = self.output_path / f"{filename}.png"
-            
-            # Save PNG file if image data exists
-            if 'image_data' in result.metadata and result.metadata['image_data']:
-                image_data = result.metadata['image_data']
-                logger.info(f"Saving PNG file: {png_path}")
-                logger.debug(f"Image data type: {type(image_data)}")
-                
-                # Image data should be bytes from Gemini API
-                if isinstance(image_data, bytes):
-                    # Apply rembg to remove background
-                    processed_image_data = self._remove_background_with_rembg(image_data)
-                    
-                    # Apply crop to remove empty space around content
-                    cropped_image_data = self._crop_to_content(processed_image_data)
-                    
-                    # Save original image (with _original suffix)
-                    original_path = self.output_path / f"{filename}_original.png"
-                    with open(original_path, 'wb') as f:
-                        f.write(image_data)
-                    logger.info(f"✅ Original PNG saved: {original_path}")
-                    
-                    # Save processed image (main file)
-                    with open(png_path, 'wb') as f:
-                        f.write(cropped_image_data)
-                    logger.info(f"✅ Processed PNG saved: {png_path}")
-                    
-                    # Analyze transparency quality
-                    self._analyze_transparency_quality(cropped_image_data, result.name)
-                    
-                else:
-                    logger.error(f"❌ Invalid image data type: {type(image_data)}")
-                    raise ValueError(f"Expected bytes, got {type(image_data)}")
-            else:
-                logger.error("❌ No image data found in result metadata")
-                raise ValueError("No image data to save")
-            
-            # Save metadata (exclude image_data to avoid JSON serialization error)
-            metadata_path = self.output_path / f"{filename}.json"
-            metadata_for_json = {k: v for k, v in result.metadata.items() if k != 'image_data'}
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata_for_json, f, indent=2)
-            
-            logger.info(f"Saved icon: {png_path}")
-            
-        except Exception as e:
-            logger.error(f"Failed to save icon {result.name}: {e}")
+    Latencies of completed calls are kept over a sliding window. Once enough
+    are observed, a call still running past the configured percentile is
+    hedged and the first response wins. A budget caps hedges at a fraction of
+    all calls so a slow backend does not get double the load.
+    """
+    
+    def __init__(self, enabled: bool = False, percentile: float = 95, min_samples: int = 10,
+                 min_delay: float = 1.0, budget: float = 0.1, window: int = 200):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = max(1, min_samples)
+        self.min_delay = min_delay
+        self.budget = budget
+        self.latencies: deque = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+    
+    @classmethod
+    def from_settings(cls, ai_settings: Dict[str, Any]) -> 'RequestHedger':
+        """Create hedger from ai_settings.hedging"""
+        hedging = ai_settings.get('hedging', {})
+        return cls(
+            enabled=hedging.get('enabled', False),
+            percentile=hedging.get('percentile', 95),
+            min_samples=hedging.get('min_samples', 10),
+            min_delay=hedging.get('min_delay', 1.0),
+            budget=hedging.get('budget', 0.1),
+            window=hedging.get('window', 200)
+        )
+    
+    def record_latency(self, seconds: float):
+        self.latencies.append(seconds)
+    
+    def delay(self) -> Optional[float]:
+        """Seconds after which a call should be hedged, None when it should not be"""
+        if not self.enabled or len(self.latencies) < self.min_samples:
+            return None
+        if self.hedges >= self.budget * self.calls:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of raw generated image bytes.
+    
+    Entries are keyed on a hash of the model, prompt and the ai_settings that
+    influence the output. Access times are tracked through file mtimes and the
+    least recently used entries are evicted once the cache exceeds its size limit.
+    """
+    
+    # ai_settings keys that change what the model returns for a prompt
+    KEY_SETTINGS = ('temperature', 'top_p', 'top_k', 'seed')
+    
+    def __init__(self, directory: Union[str, Path] = '.icon_cache', max_size_mb: float = 500):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.total_size = sum(entry.stat().st_size for entry in self._entries())
+    
+    @classmethod
+    def from_settings(cls, ai_settings: Dict[str, Any]) -> Optional['ResponseCache']:
+        """Create cache from ai_settings.cache, returns None when disabled"""
+        cache_settings = ai_settings.get('cache', {})
+        if not cache_settings.get('enabled', True):
+            return None
+        return cls(
+            directory=cache_settings.get('directory', '.icon_cache'),
+            max_size_mb=cache_settings.get('max_size_mb', 500)
+        )
+    
+    @classmethod
+    def make_key(cls, model: str, prompt: str, ai_settings: Dict[str, Any]) -> str:
+        """Compute cache key for a generation request"""
+        key_data = {
+            'model': model,
+            'prompt': prompt,
+            'settings': {k: ai_settings[k] for k in cls.KEY_SETTINGS if k in ai_settings}
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode('utf-8')).hexdigest()
     
-    async def generate_all_icons(self) -> List[IconResult]:
-        """Generate all icons from configuration"""
-        logger.info(f"Starting generation of {len(self.icon_configs)} icons")
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.bin"
+    
+    def _entries(self) -> List[Path]:
+        return list(self.directory.glob('*/*.bin'))
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """Return cached bytes for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
         
-        results = []
-        for icon_config in self.icon_configs:
-            result = await self.generate_single_icon(icon_config)
-            results.append(result)
-            
-            # Add delay between generations to avoid rate limiting
-            await asyncio.sleep(1)
+        # Mark as recently used for LRU eviction
+        os.utime(path)
+        return data
+    
+    def put(self, key: str, data: bytes):
+        """Store bytes for key and evict old entries if over the size limit"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Generate summary report
-        self._generate_summary_report(results)
+        previous_size = path.stat().st_size if path.exists() else 0
+        temp_path = path.with_suffix(f".tmp{os.getpid()}")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
         
-        return results
+        self.total_size += len(data) - previous_size
+        if self.total_size > self.max_size_bytes:
+            self._evict()
     
-    def _generate_summary_report(self, results: List[IconResult]):
-        """Generate summary report of generation session"""
-        successful = [r for r in results if r.success]
-        failed = [r for r in results if not r.success]
+    def _evict(self):
+        """Remove least recently used entries until under the size limit"""
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
         
-        total_time = sum(r.generation_time for r in results)
-        avg_time = total_time / len(results) if results else 0
+        self.total_size = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, entry in entries:
+            if self.total_size <= self.max_size_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            self.total_size -= size
+            evicted += 1
         
-        report = {
-            'project': self.project_config.name,
-            'timestamp': datetime.now().isoformat(),
-            'summary': {
-                'total_icons': len(results),
-                'successful': len(successful),
-                'failed': len(failed),
-                'success_rate': len(successful) / len(results) * 100 if results else 0,
-                'total_time': total_time,
-                'average_time': avg_time
-            },
-            'successful_icons': [r.name for r in successful],
-            'failed_icons': [{'name': r.name, 'error': r.error} for r in failed]
-        }
+        if evicted:
+            logger.info(f"🧹 Evicted {evicted} cache entries ({self.total_size / 1024 / 1024:.1f}MB remaining)")
+
+
+class PerceptualIndex:
+    """Persistent SQLite index of every generated icon, shared across projects.
+    
+    Stores a perceptual hash of each processed icon and a simhash of what its
+    prompt describes. Both 64-bit hashes are also stored split into 16-bit
+    bands in indexed columns. Two hashes within distance d have at least one
+    band within d // BANDS bits of each other, so a lookup probes every band
+    value that close and only compares the few rows it finds, which stays
+    fast as the index grows.
+    """
+    
+    BANDS = 4
+    BAND_WIDTH = 64 // BANDS
+    
+    # Larger thresholds need exponentially more probes per band
+    MAX_THRESHOLD = 11
+    
+    # 'off' ignores prompt matches, 'suggest' reports them, 'auto' reuses the matched original
+    REUSE_MODES = ('off', 'suggest', 'auto')
+    
+    def __init__(self, path: Union[str, Path] = '.icon_index.sqlite', image_threshold: int = 6,
+                 prompt_threshold: int = 3, reuse: str = 'suggest'):
+        for threshold in (image_threshold, prompt_threshold):
+            if not 0 <= threshold <= self.MAX_THRESHOLD:
+                raise ValueError(f"Hash distance thresholds must be between 0 and {self.MAX_THRESHOLD}, got {threshold}")
+        if reuse not in self.REUSE_MODES:
+            raise ValueError(f"Unknown reuse mode: {reuse}")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.image_threshold = image_threshold
+        self.prompt_threshold = prompt_threshold
+        self.reuse = reuse
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self._create_tables()
+    
+    @classmethod
+    def from_settings(cls, output_settings: Dict[str, Any]) -> Optional['PerceptualIndex']:
+        """Create index from output.dedup, returns None when disabled.
+        
+        Relative index paths resolve against the output directory like the
+        manifest, so the index does not depend on the working directory.
+        """
+        dedup = output_settings.get('dedup', {})
+        if not dedup.get('enabled', True):
+            return None
+        output_dir = Path(output_settings.get('directory', './generated-icons'))
+        return cls(
+            path=output_dir / dedup.get('index_path', '.icon_index.sqlite'),
+            image_threshold=dedup.get('image_threshold', 6),
+            prompt_threshold=dedup.get('prompt_threshold', 3),
+            reuse=dedup.get('reuse', 'suggest')
+        )
+    
+    def _create_tables(self):
+        image_bands = [f"image_band_{index}" for index in range(self.BANDS)]
+        prompt_bands = [f"prompt_band_{index}" for index in range(self.BANDS)]
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(f"""
+                CREATE TABLE IF NOT EXISTS icons (
+                    project TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    run_id TEXT,
+                    style_key TEXT NOT NULL,
+                    prompt_simhash TEXT NOT NULL,
+                    phash TEXT NOT NULL,
+                    dhash TEXT NOT NULL,
+                    original_path TEXT NOT NULL,
+                    processed_path TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    {', '.join(f"{column} INTEGER NOT NULL" for column in image_bands + prompt_bands)},
+                    PRIMARY KEY (project, name)
+                )""")
+            for column in image_bands + prompt_bands:
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS icons_{column} ON icons ({column})")
+    
+    @classmethod
+    def _bands(cls, value: int) -> List[int]:
+        return [value >> (index * cls.BAND_WIDTH) & ((1 << cls.BAND_WIDTH) - 1) for index in range(cls.BANDS)]
+    
+    @classmethod
+    def _probes(cls, band: int, radius: int) -> List[int]:
+        """Band value and every value within radius bits of it"""
+        probes = [band]
+        for distance in range(1, radius + 1):
+            for bits in itertools.combinations(range(cls.BAND_WIDTH), distance):
+                probes.append(band ^ sum(1 << bit for bit in bits))
+        return probes
+    
+    def _candidates(self, prefix: str, columns: str, value: int, threshold: int) -> List[sqlite3.Row]:
+        """Rows that can be within threshold bits of value, found through the band indexes"""
+        conditions = []
+        parameters = []
+        for index, band in enumerate(self._bands(value)):
+            probes = self._probes(band, threshold // self.BANDS)
+            conditions.append(f"{prefix}_band_{index} IN ({', '.join('?' * len(probes))})")
+            parameters.extend(probes)
+        return self.connection.execute(f"SELECT {columns} FROM icons WHERE {' OR '.join(conditions)}",
+                                       parameters).fetchall()
+    
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM icons").fetchone()[0]
+    
+    def add(self, project: str, name: str, run_id: Optional[str], style_key: str, prompt_simhash: str,
+            phash: str, dhash: str, original_path: Path, processed_path: Path):
+        """Insert or replace the entry of one icon, hashes are hex strings"""
+        image_bands = self._bands(int(phash, 16))
+        prompt_bands = self._bands(int(prompt_simhash, 16))
+        values = [project, name, run_id, style_key, prompt_simhash, phash, dhash,
+                  str(Path(original_path).resolve()), str(Path(processed_path).resolve()),
+                  datetime.now().isoformat(), *image_bands, *prompt_bands]
+        with self.connection:
+            self.connection.execute(f"INSERT OR REPLACE INTO icons VALUES ({', '.join('?' * len(values))})", values)
+    
+    def find_similar_images(self, phash: str, dhash: str, exclude: tuple[str, str]) -> List[Dict[str, Any]]:
+        """Indexed icons whose perceptual hash is within the image threshold, closest first"""
+        value = int(phash, 16)
+        matches = []
+        rows = self._candidates('image', 'project, name, run_id, phash, dhash, processed_path',
+                                value, self.image_threshold)
+        for row in rows:
+            distance = _hamming_distance(value, int(row['phash'], 16))
+            if distance <= self.image_threshold and (row['project'], row['name']) != exclude:
+                matches.append({
+                    'project': row['project'],
+                    'name': row['name'],
+                    'run_id': row['run_id'],
+                    'distance': distance,
+                    'dhash_distance': _hamming_distance(int(dhash, 16), int(row['dhash'], 16)),
+                    'processed_path': row['processed_path']
+                })
+        return sorted(matches, key=lambda match: (match['distance'], match['dhash_distance']))
+    
+    def find_similar_prompt(self, prompt_simhash: str, style_key: str, exclude: tuple[str, str]
+                            ) -> Optional[Dict[str, Any]]:
+        """Closest indexed icon with the same style whose prompt is within the prompt threshold.
+        
+        Entries whose original file is gone are dropped from the index.
+        """
+        value = int(prompt_simhash, 16)
+        best = None
+        rows = self._candidates('prompt', 'project, name, style_key, prompt_simhash, original_path',
+                                value, self.prompt_threshold)
+        for row in rows:
+            if row['style_key'] != style_key or (row['project'], row['name']) == exclude:
+                continue
+            distance = _hamming_distance(value, int(row['prompt_simhash'], 16))
+            if distance > self.prompt_threshold or (best and best['distance'] <= distance):
+                continue
+            if not Path(row['original_path']).exists():
+                with self.connection:
+                    self.connection.execute("DELETE FROM icons WHERE project = ? AND name = ?",
+                                            (row['project'], row['name']))
+                continue
+            best = {
+                'project': row['project'],
+                'name': row['name'],
+                'distance': distance,
+                'original_path': row['original_path']
+            }
+        return best
+    
+    def close(self):
+        self.connection.close()
+
+
+class ImageBackend(ABC):
+    """Interface for image generation backends used by generate_single_icon"""
+    
+    name = 'base'
+    generation_method = 'unknown'
+    
+    def __init__(self, model: str):
+        self.model = model
+    
+    @abstractmethod
+    async def generate(self, prompt: str) -> bytes:
+        """Generate an image for the prompt, returns encoded image bytes"""
+        raise NotImplementedError
+    
+    def close(self):
+        """Release backend resources"""
+
+    async def aclose(self):
+        """Release resources bound to the running event loop"""
+
+
+class GeminiImageBackend(ImageBackend):
+    """Gemini generate_content image generation over the native async client.
+    
+    Requests share one keep-alive httpx connection pool sized by
+    ai_settings.http.pool_size, so concurrency is not tied to a thread pool.
+    The pool belongs to the event loop it was created in and is rebuilt if
+    the backend is used from a new loop.
+    """
+    
+    name = 'gemini'
+    generation_method = 'gemini_generate_content_api'
+    
+    def __init__(self, model: str, http_settings: Optional[Dict[str, Any]] = None):
+        super().__init__(model)
+        self.api_key = os.getenv('GOOGLE_API_KEY')
+        if not self.api_key:
+            raise ValueError("GOOGLE_API_KEY environment variable is required")
+        
+        http_settings = http_settings or {}
+        self.pool_size = max(1, int(http_settings.get('pool_size', 4)))
+        self.timeout = float(http_settings.get('timeout', 120))
+        self.keepalive_expiry = float(http_settings.get('keepalive_expiry', 30))
+        self.client = None
+        self._http_client = None
+        self._client_loop = None
+    
+    def _get_client(self):
+        """Gemini client for the running loop, created with a pooled async HTTP client"""
+        loop = asyncio.get_running_loop()
+        if self.client is None or self._client_loop is not loop:
+            import httpx
+            from google import genai
+            from google.genai import types
+            
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size,
+                                    keepalive_expiry=self.keepalive_expiry),
+                timeout=self.timeout
+            )
+            self.client = genai.Client(
+                api_key=self.api_key,
+                http_options=types.HttpOptions(timeout=int(self.timeout * 1000),
+                                               httpx_async_client=self._http_client)
+            )
+            self._client_loop = loop
+            logger.info(f"🔌 Gemini connection pool ready ({self.pool_size} connections, {self.timeout:.0f}s timeout)")
+        return self.client
+    
+    async def generate(self, prompt: str) -> bytes:
+        response = await self._get_client().aio.models.generate_content(
+            model=self.model,
+            contents=[prompt]
+        )
+        
+        # Parse response to get image data
+        for part in response.candidates[0].content.parts:
+            if part.inline_data is not None:
+                return part.inline_data.data
+        
+        raise ValueError("No image data found in response")
+    
+    async def aclose(self):
+        if self._http_client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._http_client.aclose()
+        self.client = None
+        self._http_client = None
+        self._client_loop = None
+
+
+class SyntheticBackendError(Exception):
+    """Simulated API failure raised by SyntheticImageBackend"""
+    
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class SyntheticImageBackend(ImageBackend):
+    """Offline stand-in backend for load testing without the live API.
+    
+    Returns procedurally generated PNGs derived from a hash of the prompt, so
+    the same prompt always yields the same image. Latency is sampled from a
+    configurable distribution and a configurable share of calls fail with
+    simulated quota (429) or server (503) errors.
+    """
+    
+    name = 'synthetic'
+    generation_method = 'synthetic_backend'
+    
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        super().__init__(settings.get('model', 'synthetic-v1'))
+        self.size = settings.get('size', 1024)
+        self.latency = settings.get('latency', {'distribution': 'lognormal', 'median': 8.0, 'sigma': 0.5})
+        self.error_rate = settings.get('error_rate', 0.0)
+        self.quota_error_rate = settings.get('quota_error_rate', 0.0)
+        self.random = random.Random(settings.get('seed'))
+    
+    def _sample_latency(self) -> float:
+        distribution = self.latency.get('distribution', 'lognormal')
+        if distribution == 'fixed':
+            return self.latency.get('median', 0.0)
+        if distribution == 'uniform':
+            return self.random.uniform(self.latency.get('min', 0.0), self.latency.get('max', 1.0))
+        if distribution == 'lognormal':
+            median = self.latency.get('median', 8.0)
+            return median * math.exp(self.random.gauss(0, self.latency.get('sigma', 0.5))) if median > 0 else 0.0
+        raise ValueError(f"Unknown latency distribution: {distribution}")
+    
+    async def generate(self, prompt: str) -> bytes:
+        await asyncio.sleep(self._sample_latency())
+        
+        roll = self.random.random()
+        if roll < self.quota_error_rate:
+            raise SyntheticBackendError(429, "RESOURCE_EXHAUSTED: simulated quota error")
+        if roll < self.quota_error_rate + self.error_rate:
+            raise SyntheticBackendError(503, "UNAVAILABLE: simulated server error")
+        
+        return await asyncio.to_thread(_render_synthetic_icon, prompt, self.size)
+
+
+def _render_synthetic_icon(prompt: str, size: int) -> bytes:
+    """Render a deterministic icon-like PNG for a prompt"""
+    from PIL import ImageDraw
+    
+    seed = int.from_bytes(hashlib.sha256(prompt.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(seed)
+    
+    # Light flat background for background removal to strip
+    background = tuple(rng.randint(225, 255) for _ in range(3))
+    image = Image.new('RGB', (size, size), background)
+    draw = ImageDraw.Draw(image)
+    
+    # A few overlapping shapes placed around an off-center point
+    center_x = size * rng.uniform(0.35, 0.65)
+    center_y = size * rng.uniform(0.35, 0.65)
+    for _ in range(rng.randint(2, 5)):
+        color = tuple(rng.randint(0, 180) for _ in range(3))
+        radius = size * rng.uniform(0.08, 0.25)
+        x = center_x + size * rng.uniform(-0.12, 0.12)
+        y = center_y + size * rng.uniform(-0.12, 0.12)
+        box = [x - radius, y - radius, x + radius, y + radius]
+        shape = rng.choice(('ellipse', 'rectangle', 'polygon'))
+        if shape == 'ellipse':
+            draw.ellipse(box, fill=color)
+        elif shape == 'rectangle':
+            draw.rounded_rectangle(box, radius=radius * 0.3, fill=color)
+        else:
+            draw.regular_polygon((x, y, radius), n_sides=rng.randint(3, 8), fill=color)
+    
+    output = BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def create_image_backend(ai_settings: Dict[str, Any], backend_name: Optional[str] = None) -> ImageBackend:
+    """Create the image backend selected by ai_settings.backend or an explicit name"""
+    backend_name = backend_name or ai_settings.get('backend', 'gemini')
+    if backend_name == 'gemini':
+        http_settings = {'pool_size': ai_settings.get('max_concurrency', 4), **ai_settings.get('http', {})}
+        return GeminiImageBackend(ai_settings.get('image_model', 'gemini-2.5-flash-image-preview'), http_settings)
+    if backend_name == 'synthetic':
+        return SyntheticImageBackend(ai_settings.get('synthetic', {}))
+    raise ValueError(f"Unknown image backend: {backend_name}")
+
+
+class RunJournal:
+    """Append-only JSONL journal of a generation run.
+    
+    A 'run_started' event is followed by one 'icon_completed' event per finished
+    icon, each flushed to disk as soon as it is written, so an interrupted run
+    can be resumed and reported on without repeating completed icons.
+    """
+    
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.run_id: Optional[str] = None
+    
+    def read(self) -> List[Dict[str, Any]]:
+        """Read all journal events, ignoring a truncated trailing line"""
+        events = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping corrupt journal line in {self.path}")
+        except FileNotFoundError:
+            pass
+        return events
+    
+    def _append(self, event: Dict[str, Any]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def start(self, project: str, icon_names: List[str], resume: bool = False) -> bool:
+        """Start a new run, or continue the journaled one when resuming.
+        
+        Returns True when an existing run is being resumed.
+        """
+        if resume:
+            for event in self.read():
+                if event.get('event') == 'run_started':
+                    self.run_id = event['run_id']
+            if self.run_id:
+                logger.info(f"📒 Resuming run {self.run_id} from {self.path}")
+                self._append({'event': 'run_resumed', 'run_id': self.run_id,
+                              'timestamp': datetime.now().isoformat()})
+                return True
+            logger.warning(f"No journal to resume at {self.path}, starting a new run")
+        
+        self.run_id = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.path.unlink(missing_ok=True)
+        self._append({'event': 'run_started', 'run_id': self.run_id, 'project': project,
+                      'icons': icon_names, 'timestamp': datetime.now().isoformat()})
+        return False
+    
+    def record(self, result: IconResult, manifest_entry: Optional[Dict[str, Any]] = None):
+        """Append the outcome of one icon"""
+        self._append({'event': 'icon_completed', 'run_id': self.run_id, **self.to_event(result, manifest_entry)})
+    
+    @staticmethod
+    def to_event(result: IconResult, manifest_entry: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Outcome of one icon as recorded in the journal, also used to hand results between processes"""
+        return {
+            'name': result.name,
+            'success': result.success,
+            'error': result.error,
+            'generation_time': result.generation_time,
+            'metadata': result.metadata,
+            'manifest_entry': manifest_entry,
+            'spans': result.spans,
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def completed(self) -> Dict[str, Dict[str, Any]]:
+        """Latest 'icon_completed' event per icon for the current run"""
+        latest = {}
+        for event in self.read():
+            if event.get('event') == 'icon_completed' and event.get('run_id') == self.run_id:
+                latest[event['name']] = event
+        return latest
+    
+    @staticmethod
+    def to_result(event: Dict[str, Any]) -> IconResult:
+        """Rebuild an IconResult from an 'icon_completed' event"""
+        return IconResult(
+            name=event['name'],
+            metadata=event.get('metadata', {}),
+            generation_time=event.get('generation_time', 0.0),
+            success=event.get('success', False),
+            error=event.get('error'),
+            spans=event.get('spans', [])
+        )
+
+
+def _atomic_write(path: Path, data: bytes, fsync: bool = False):
+    """Write a file through a temporary sibling and rename it into place,
+    so readers never see a partially written file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def _write_file_groups(groups: List[List[tuple[Path, bytes]]], fsync: bool) -> List[Optional[Exception]]:
+    """Write a batch of file groups, returns the error of each group or None"""
+    errors = []
+    for files in groups:
+        try:
+            # Files are renamed in order, so a group's last file marks it complete
+            for path, data in files:
+                _atomic_write(path, data, fsync)
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
+
+
+class OutputWriter:
+    """Async writer stage for output files.
+    
+    Writes are queued and flushed in batches on a small thread pool, so file
+    I/O never blocks the event loop. Each file is written to a temporary
+    sibling and renamed into place, so an interrupted run leaves either the
+    previous or the new file, never a partial one.
+    """
+    
+    def __init__(self, workers: int = 2, batch_size: int = 16, fsync: bool = False):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+    
+    @classmethod
+    def from_settings(cls, output_settings: Dict[str, Any]) -> 'OutputWriter':
+        """Create writer from output.writer"""
+        writer = output_settings.get('writer', {})
+        return cls(
+            workers=writer.get('workers', 2),
+            batch_size=writer.get('batch_size', 16),
+            fsync=writer.get('fsync', False)
+        )
+    
+    def _start(self):
+        """Start the flush tasks in the running loop"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='output-writer')
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.ensure_future(self._flush_batches()) for _ in range(self.workers)]
+    
+    async def write(self, files: List[tuple[Path, bytes]]):
+        """Write a group of files in order, returns once all of them are in place"""
+        if self._queue is None or any(task.done() for task in self._tasks):
+            self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((files, future))
+        await future
+    
+    async def _flush_batches(self):
+        """Take queued groups in batches and write them on the thread pool"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            try:
+                errors = await loop.run_in_executor(self._executor, _write_file_groups,
+                                                    [files for files, _ in batch], self.fsync)
+            except Exception as e:
+                errors = [e] * len(batch)
+            for (_, future), error in zip(batch, errors):
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+    
+    async def aclose(self):
+        """Stop the flush tasks, writes already handed to the pool still finish in close()"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+    
+    def close(self):
+        """Shut down the thread pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+# Stages traced per icon, in the order they run
+TRACE_STAGES = ['prompt_build', 'read_original', 'cache_lookup', 'index_lookup', 'api_queue', 'rate_limit_wait',
+                'api_call', 'retry_backoff', 'decode', 'background_removal', 'crop', 'analysis', 'perceptual_hash',
+                'export', 'encode', 'write']
+
+# Upper bounds in seconds of the stage duration histogram buckets
+TRACE_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+
+
+class SpanRecorder:
+    """Collects timed stage spans for one icon"""
+    
+    def __init__(self, spans: Optional[List[Dict[str, Any]]] = None):
+        self.spans = spans if spans is not None else []
+    
+    def add(self, stage: str, start: float, duration: float, **attributes):
+        """Record a finished span, start is a wall-clock timestamp"""
+        span = {'stage': stage, 'start': start, 'duration': duration}
+        if attributes:
+            span['attributes'] = attributes
+        self.spans.append(span)
+    
+    @contextmanager
+    def span(self, stage: str, **attributes):
+        """Time the enclosed block as one span, yields its attributes for the block to extend"""
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes['error'] = type(e).__name__
+            raise
+        finally:
+            self.add(stage, start, time.perf_counter() - started, **attributes)
+
+
+def _aggregate_stage_spans(results: List[IconResult]) -> Dict[str, Dict[str, Any]]:
+    """Per-stage duration statistics and cumulative histogram buckets over all icons"""
+    durations: Dict[str, List[float]] = {}
+    for result in results:
+        for span in result.spans:
+            durations.setdefault(span['stage'], []).append(span['duration'])
+    
+    total = sum(sum(values) for values in durations.values())
+    order = {stage: index for index, stage in enumerate(TRACE_STAGES)}
+    histograms = {}
+    for stage in sorted(durations, key=lambda stage: order.get(stage, len(order))):
+        values = np.array(durations[stage])
+        buckets = {str(bound): int((values <= bound).sum()) for bound in TRACE_BUCKETS}
+        buckets['+Inf'] = len(values)
+        histograms[stage] = {
+            'count': len(values),
+            'sum': float(values.sum()),
+            'mean': float(values.mean()),
+            'p50': float(np.percentile(values, 50)),
+            'p95': float(np.percentile(values, 95)),
+            'max': float(values.max()),
+            'share_of_traced_time': float(values.sum() / total) if total else 0.0,
+            'buckets': buckets
+        }
+    return histograms
+
+
+def _prometheus_label(value: str) -> str:
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_prometheus_metrics(project: str, histograms: Dict[str, Dict[str, Any]],
+                               results: List[IconResult]) -> str:
+    """Render stage histograms and icon outcome counts in the Prometheus text format"""
+    project_label = f'project="{_prometheus_label(project)}"'
+    lines = [
+        '# HELP icon_stage_duration_seconds Time spent per icon in each generation stage',
+        '# TYPE icon_stage_duration_seconds histogram'
+    ]
+    for stage, stats in histograms.items():
+        labels = f'{project_label},stage="{stage}"'
+        for bound, count in stats['buckets'].items():
+            lines.append(f'icon_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'icon_stage_duration_seconds_sum{{{labels}}} {stats["sum"]:.6f}')
+        lines.append(f'icon_stage_duration_seconds_count{{{labels}}} {stats["count"]}')
+    
+    outcomes = {'generated': 0, 'reprocessed': 0, 'up_to_date': 0, 'failed': 0}
+    for result in results:
+        status = result.metadata.get('build_status', 'generated') if result.success else 'failed'
+        outcomes[status] = outcomes.get(status, 0) + 1
+    lines += [
+        '# HELP icon_generation_icons Icons in the last run by outcome',
+        '# TYPE icon_generation_icons gauge'
+    ]
+    for status, count in outcomes.items():
+        lines.append(f'icon_generation_icons{{{project_label},status="{status}"}} {count}')
+    
+    lines += [
+        '# HELP icon_generation_seconds_total End-to-end generation time summed over icons',
+        '# TYPE icon_generation_seconds_total counter',
+        f'icon_generation_seconds_total{{{project_label}}} {sum(r.generation_time for r in results):.6f}'
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+# Post-processing stages run in worker processes, so they live at module level
+
+# Long-lived rembg sessions for this process, keyed by model name and ONNX thread count
+_rembg_sessions: Dict[tuple, Any] = {}
+_rembg_sessions_lock = threading.Lock()
+
+def _new_rembg_session(model_name: str, onnx_threads: Optional[int]):
+    """Create a rembg session, with explicit ONNX thread counts when given.
+    
+    rembg's new_session reads thread counts from OMP_NUM_THREADS, which would
+    change every other library in the process, so sessions with a thread
+    count are built from their session class with their own SessionOptions.
+    """
+    if not onnx_threads:
+        from rembg import new_session
+        return new_session(model_name)
+    
+    import onnxruntime
+    from rembg.sessions import sessions_class
+    session_class = next((cls for cls in sessions_class if cls.name() == model_name), None)
+    if session_class is None:
+        raise ValueError(f"Unknown rembg model: {model_name}")
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = onnx_threads
+    options.inter_op_num_threads = onnx_threads
+    return session_class(model_name, options)
+
+def _get_rembg_session(model_name: str = 'u2net', onnx_threads: Optional[int] = None):
+    """Get the rembg session for this process, loading the model on first use"""
+    with _rembg_sessions_lock:
+        session = _rembg_sessions.get((model_name, onnx_threads))
+        if session is None:
+            start_time = time.time()
+            session = _new_rembg_session(model_name, onnx_threads)
+            _rembg_sessions[(model_name, onnx_threads)] = session
+            logger.info(f"🧠 Loaded rembg model '{model_name}' in {time.time() - start_time:.2f}s")
+        return session
+
+def _init_postprocess_worker(rembg_model: str, onnx_threads: Optional[int]):
+    """Process pool initializer, loads the rembg model once per worker"""
+    try:
+        _get_rembg_session(rembg_model, onnx_threads)
+    except Exception as e:
+        logger.error(f"❌ Failed to load rembg model '{rembg_model}': {e}")
+
+def _remove_background_with_rembg(image: Image.Image, model_name: str = 'u2net',
+                                  onnx_threads: Optional[int] = None) -> Image.Image:
+    """Remove background using rembg library"""
+    try:
+        session = _get_rembg_session(model_name, onnx_threads)
+        
+        logger.info("🎨 Removing background with rembg...")
+        start_time = time.time()
+        
+        # Apply rembg to remove background, PIL images in and out avoid a PNG round-trip
+        from rembg import remove
+        processed_image = remove(image, session=session)
+        if processed_image.mode != 'RGBA':
+            processed_image = processed_image.convert('RGBA')
+        
+        processing_time = time.time() - start_time
+        logger.info(f"✅ Background removed successfully in {processing_time:.2f}s")
+        
+        return processed_image
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to remove background with rembg: {e}")
+        # Return original image if rembg fails
+        return image
+
+def _crop_to_content(image: Image.Image, crop_config: Dict[str, Any]) -> Image.Image:
+    """Crop image to content with configurable aspect ratio and smart padding"""
+    # Default values
+    enabled = crop_config.get('enabled', True)
+    aspect_ratio = crop_config.get('aspect_ratio', 'square')
+    padding_percentage = crop_config.get('padding_percentage', 15) / 100.0
+    min_padding = crop_config.get('min_padding_px', 10)
+    
+    if not enabled:
+        logger.info("🚫 Cropping disabled in config")
+        return image
+    
+    try:
+        logger.info(f"✂️ Cropping to content with {aspect_ratio} aspect ratio...")
+        start_time = time.time()
+        
+        # Convert to RGBA if not already
+        if image.mode != 'RGBA':
+            image = image.convert('RGBA')
+        
+        # Get the bounding box of non-transparent pixels
+        bbox = image.getbbox()
+        
+        if bbox:
+            left, top, right, bottom = bbox
+            content_width = right - left
+            content_height = bottom - top
+            
+            # Calculate padding
+            padding_x = max(min_padding, int(content_width * padding_percentage))
+            padding_y = max(min_padding, int(content_height * padding_percentage))
+            
+            # Add padding to content bounds
+            padded_left = max(0, left - padding_x)
+            padded_top = max(0, top - padding_y)
+            padded_right = min(image.width, right + padding_x)
+            padded_bottom = min(image.height, bottom + padding_y)
+            
+            # Calculate dimensions with padding
+            padded_width = padded_right - padded_left
+            padded_height = padded_bottom - padded_top
+            
+            # Apply aspect ratio
+            if aspect_ratio == 'square':
+                # Make it square by using the larger dimension
+                final_size = max(padded_width, padded_height)
+                final_width = final_height = final_size
+            elif aspect_ratio == 'original':
+                # Keep original proportions
+                final_width = padded_width
+                final_height = padded_height
+            else:
+                # For future: support custom ratios like "16:9", "4:3", etc.
+                final_width = padded_width
+                final_height = padded_height
+            
+            # Calculate center point
+            center_x = (padded_left + padded_right) // 2
+            center_y = (padded_top + padded_bottom) // 2
+            
+            # Calculate crop bounds centered on content
+            half_width = final_width // 2
+            half_height = final_height // 2
+            crop_left = max(0, center_x - half_width)
+            crop_top = max(0, center_y - half_height)
+            crop_right = min(image.width, crop_left + final_width)
+            crop_bottom = min(image.height, crop_top + final_height)
+            
+            # Adjust if we hit image boundaries
+            if crop_right - crop_left < final_width:
+                crop_left = max(0, crop_right - final_width)
+            if crop_bottom - crop_top < final_height:
+                crop_top = max(0, crop_bottom - final_height)
+            
+            # Crop the image
+            cropped_image = image.crop((crop_left, crop_top, crop_right, crop_bottom))
+            
+            # If the cropped image is smaller than target size (due to image boundaries),
+            # create a new image and paste the cropped content in the center
+            if cropped_image.size != (final_width, final_height):
+                target_image = Image.new('RGBA', (final_width, final_height), (0, 0, 0, 0))
+                paste_x = (final_width - cropped_image.width) // 2
+                paste_y = (final_height - cropped_image.height) // 2
+                target_image.paste(cropped_image, (paste_x, paste_y))
+                cropped_image = target_image
+            
+            processing_time = time.time() - start_time
+            logger.info(f"✅ Cropped to {aspect_ratio} content in {processing_time:.2f}s")
+            logger.info(f"   • Original content: {content_width}x{content_height}")
+            logger.info(f"   • Final size: {cropped_image.size}")
+            logger.info(f"   • Padding: {padding_percentage*100:.0f}% ({padding_x}px x {padding_y}px)")
+            
+            return cropped_image
+        else:
+            logger.warning("⚠️ No content found to crop, returning original")
+            return image
+            
+    except Exception as e:
+        logger.error(f"❌ Failed to crop image: {e}")
+        return image
+
+# Android density buckets and their scale relative to mdpi
+ANDROID_DENSITY_SCALES = {
+    'mdpi': 1.0,
+    'hdpi': 1.5,
+    'xhdpi': 2.0,
+    'xxhdpi': 3.0,
+    'xxxhdpi': 4.0
+}
+
+# AppIcon.appiconset slots as (idiom, size in points, scale)
+IOS_APP_ICON_SLOTS = [
+    ('iphone', 20, 2), ('iphone', 20, 3), ('iphone', 29, 2), ('iphone', 29, 3),
+    ('iphone', 40, 2), ('iphone', 40, 3), ('iphone', 60, 2), ('iphone', 60, 3),
+    ('ipad', 20, 1), ('ipad', 20, 2), ('ipad', 29, 1), ('ipad', 29, 2),
+    ('ipad', 40, 1), ('ipad', 40, 2), ('ipad', 76, 1), ('ipad', 76, 2), ('ipad', 83.5, 2),
+    ('ios-marketing', 1024, 1)
+]
+
+WEB_FAVICON_SIZES = [16, 32, 48]
+WEB_PWA_SIZES = [192, 512]
+
+def _fit_to_square(image: Image.Image) -> Image.Image:
+    """Center image on a transparent square canvas"""
+    if image.width == image.height:
+        return image
+    size = max(image.width, image.height)
+    canvas = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    canvas.paste(image, ((size - image.width) // 2, (size - image.height) // 2))
+    return canvas
+
+def _resize_to_standard_sizes(image: Image.Image, icon_name: str,
+                              sizes: Optional[Dict[str, int]] = None) -> Dict[str, Image.Image]:
+    """Resize icon to standard sizes (Android launcher densities by default).
+    
+    Sizes are produced largest first through a resolution pyramid, each one
+    downscaled from the closest larger size instead of the full-size source.
+    """
+    if sizes is None:
+        sizes = {density: round(48 * scale) for density, scale in ANDROID_DENSITY_SCALES.items()}
+    
+    try:
+        logger.info(f"📐 Resizing '{icon_name}' to {len(sizes)} standard sizes...")
+        start_time = time.time()
+        
+        # Convert to RGBA if not already
+        if image.mode != 'RGBA':
+            image = image.convert('RGBA')
+        image = _fit_to_square(image)
+        
+        resized_images = {}
+        source = image
+        
+        for label, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            if size > image.width:
+                logger.warning(f"   • {label}: upscaling {image.width}px source to {size}px")
+                resized = image.resize((size, size), Image.Resampling.LANCZOS)
+            elif size == source.width:
+                resized = source
+            else:
+                # Resize with high quality, encoding is left to the writer
+                resized = source.resize((size, size), Image.Resampling.LANCZOS)
+                source = resized
+            
+            resized_images[label] = resized
+            logger.debug(f"   • {label}: {size}x{size}px")
+        
+        processing_time = time.time() - start_time
+        logger.info(f"✅ Resized to {len(sizes)} standard sizes in {processing_time:.2f}s")
+        
+        return resized_images
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to resize image: {e}")
+        return {}
+
+def _android_resource_name(name: str) -> str:
+    """Convert icon name to a valid Android resource name"""
+    resource_name = re.sub(r'[^a-z0-9_]', '_', name.lower())
+    return resource_name if resource_name[:1].isalpha() else f"ic_{resource_name}"
+
+def _plan_platform_exports(platform: str, asset_name: str, asset_type: str, base_size: int
+                           ) -> tuple[List[tuple[str, int, bool]], Dict[str, Any]]:
+    """Plan export files for one platform.
+    
+    Returns (relative path, pixel size, opaque) entries for images and a map of
+    extra JSON files (Contents.json, web manifest) to their content.
+    """
+    images = []
+    extra_files = {}
+    
+    if platform == 'android':
+        resource_name = _android_resource_name(asset_name)
+        if asset_type == 'app_icon':
+            for density, scale in ANDROID_DENSITY_SCALES.items():
+                images.append((f"android/res/mipmap-{density}/{resource_name}.png", round(48 * scale), False))
+            images.append((f"android/playstore/{resource_name}.png", 512, False))
+        else:
+            for density, scale in ANDROID_DENSITY_SCALES.items():
+                images.append((f"android/res/drawable-{density}/{resource_name}.png", round(base_size * scale), False))
+    
+    elif platform == 'ios':
+        contents_images = []
+        if asset_type == 'app_icon':
+            set_dir = f"ios/{asset_name}.appiconset"
+            for idiom, points, scale in IOS_APP_ICON_SLOTS:
+                pixels = round(points * scale)
+                filename = f"{asset_name}-{pixels}.png"
+                # App Store rejects app icons with an alpha channel
+                images.append((f"{set_dir}/{filename}", pixels, True))
+                contents_images.append({
+                    'filename': filename,
+                    'idiom': idiom,
+                    'scale': f"{scale}x",
+                    'size': f"{points:g}x{points:g}"
+                })
+        else:
+            set_dir = f"ios/{asset_name}.imageset"
+            for scale in (1, 2, 3):
+                filename = f"{asset_name}.png" if scale == 1 else f"{asset_name}@{scale}x.png"
+                images.append((f"{set_dir}/{filename}", base_size * scale, False))
+                contents_images.append({'filename': filename, 'idiom': 'universal', 'scale': f"{scale}x"})
+        
+        extra_files[f"{set_dir}/Contents.json"] = {
+            'images': contents_images,
+            'info': {'author': 'xcode', 'version': 1}
+        }
+    
+    elif platform == 'web':
+        web_dir = f"web/{asset_name}"
+        if asset_type == 'app_icon':
+            for size in WEB_FAVICON_SIZES[:2]:
+                images.append((f"{web_dir}/favicon-{size}x{size}.png", size, False))
+            images.append((f"{web_dir}/apple-touch-icon.png", 180, True))
+            for size in WEB_PWA_SIZES:
+                images.append((f"{web_dir}/icon-{size}.png", size, False))
+            extra_files[f"{web_dir}/manifest.webmanifest"] = {
+                'icons': [{'src': f"icon-{size}.png", 'sizes': f"{size}x{size}", 'type': 'image/png'}
+                          for size in WEB_PWA_SIZES]
+            }
+        else:
+            for scale in (1, 2, 3):
+                images.append((f"{web_dir}/{asset_name}-{base_size * scale}.png", base_size * scale, False))
+    
+    else:
+        logger.warning(f"⚠️ No export profile for platform '{platform}', skipping")
+    
+    return images, extra_files
+
+def _export_platform_assets(image: Image.Image, asset_name: str, settings: Dict[str, Any]) -> List[str]:
+    """Export icon assets for every target platform.
+    
+    Returns written file paths relative to the export directory.
+    """
+    try:
+        start_time = time.time()
+        export_dir = Path(settings['directory'])
+        asset_type = settings.get('asset_type', 'app_icon')
+        base_size = settings.get('base_size', 24)
+        background_color = settings.get('background_color', '#FFFFFF')
+        
+        images = []
+        extra_files = {}
+        for platform in settings['platforms']:
+            platform_images, platform_files = _plan_platform_exports(platform, asset_name, asset_type, base_size)
+            images.extend(platform_images)
+            extra_files.update(platform_files)
+        
+        # Several iOS slots share a pixel size and file, write each one once
+        images = list(dict.fromkeys(images))
+        
+        include_favicon = 'web' in settings['platforms'] and asset_type == 'app_icon'
+        sizes = {size for _, size, _ in images}
+        if include_favicon:
+            sizes.update(WEB_FAVICON_SIZES)
+        if not sizes:
+            return []
+        
+        pyramid = _resize_to_standard_sizes(image, asset_name, {str(size): size for size in sizes})
+        
+        def write_image(relative_path: str, size: int, opaque: bool):
+            resized = pyramid[str(size)]
+            if opaque:
+                background = Image.new('RGBA', resized.size, background_color)
+                resized = Image.alpha_composite(background, resized).convert('RGB')
+            _atomic_write(export_dir / relative_path,
+                          _encode_with_profile(resized, settings.get('png_profile', 'png'), settings))
+        
+        def write_json(relative_path: str, content: Dict[str, Any]):
+            _atomic_write(export_dir / relative_path, json.dumps(content, indent=2).encode('utf-8'))
+        
+        def write_favicon(relative_path: str):
+            output = BytesIO()
+            pyramid[str(max(WEB_FAVICON_SIZES))].save(output, format='ICO',
+                                                      sizes=[(size, size) for size in WEB_FAVICON_SIZES])
+            _atomic_write(export_dir / relative_path, output.getvalue())
+        
+        # PNG encoding releases the GIL, so outputs are written on a thread pool
+        with ThreadPoolExecutor(max_workers=min(8, len(images) + len(extra_files) + 1)) as executor:
+            futures = [executor.submit(write_image, *entry) for entry in images]
+            futures += [executor.submit(write_json, path, content) for path, content in extra_files.items()]
+            if include_favicon:
+                futures.append(executor.submit(write_favicon, f"web/{asset_name}/favicon.ico"))
+            for future in futures:
+                future.result()
+        
+        written = [path for path, _, _ in images] + list(extra_files)
+        if include_favicon:
+            written.append(f"web/{asset_name}/favicon.ico")
+        
+        processing_time = time.time() - start_time
+        logger.info(f"📦 Exported {len(written)} assets for {', '.join(settings['platforms'])} in {processing_time:.2f}s")
+        
+        return sorted(written)
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to export platform assets for {asset_name}: {e}")
+        return []
+
+def _analyze_transparency_quality(image: Image.Image, icon_name: str) -> Dict[str, Any]:
+    """Analyze transparency quality of processed image.
+    
+    Views the image once as a NumPy array and derives every statistic from it:
+    alpha histogram, content bounding box fill ratio, edge halo score and an
+    estimate of the number of distinct colours.
+    """
+    try:
+        supports_transparency = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        
+        pixels = np.asarray(image if image.mode == 'RGBA' else image.convert('RGBA'))
+        alpha = pixels[..., 3]
+        total_pixels = alpha.size
+        
+        # Alpha histogram, reported in 8 buckets of 32 levels
+        alpha_histogram = np.bincount(alpha.ravel(), minlength=256)
+        transparent_pixels = int(alpha_histogram[:128].sum())
+        transparency_percentage = transparent_pixels / total_pixels * 100
+        
+        # Content bounding box and how much of it is filled
+        opaque = alpha >= 128
+        opaque_pixels = total_pixels - transparent_pixels
+        rows = np.flatnonzero(opaque.any(axis=1))
+        cols = np.flatnonzero(opaque.any(axis=0))
+        if rows.size:
+            bbox = [int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1]
+            bbox_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+            fill_ratio = opaque_pixels / bbox_area
+        else:
+            bbox = None
+            fill_ratio = 0.0
+        
+        # Edge halo: semi-transparent pixels per pixel of content perimeter,
+        # roughly the width in pixels of the fringe left around the content
+        semi_transparent_pixels = int(alpha_histogram[16:240].sum())
+        padded = np.pad(opaque, 1, constant_values=False)
+        interior = padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+        perimeter_pixels = int((opaque & ~interior).sum())
+        halo_score = semi_transparent_pixels / perimeter_pixels if perimeter_pixels else 0.0
+        
+        # Colour count estimate over visible pixels, quantized to 5 bits per channel
+        visible_rgb = pixels[opaque][:, :3].astype(np.uint32) >> 3
+        packed = (visible_rgb[:, 0] << 10) | (visible_rgb[:, 1] << 5) | visible_rgb[:, 2]
+        color_count = int(np.unique(packed).size)
+        
+        if transparency_percentage > 50:
+            quality = 'excellent'
+        elif transparency_percentage > 20:
+            quality = 'good'
+        else:
+            quality = 'limited'
+        
+        report = {
+            'width': image.width,
+            'height': image.height,
+            'supports_transparency': supports_transparency,
+            'transparent_pixels': transparent_pixels,
+            'transparency_percentage': transparency_percentage,
+            'alpha_histogram': alpha_histogram.reshape(8, 32).sum(axis=1).tolist(),
+            'content_bbox': bbox,
+            'bbox_fill_ratio': fill_ratio,
+            'semi_transparent_pixels': semi_transparent_pixels,
+            'edge_halo_score': halo_score,
+            'color_count_estimate': color_count,
+            'quality': quality
+        }
+        
+        logger.info(f"📊 Icon '{icon_name}' transparency analysis:")
+        logger.info(f"   • Transparent pixels: {transparent_pixels:,} ({transparency_percentage:.1f}%)")
+        logger.info(f"   • Image size: {image.width}x{image.height}")
+        logger.info(f"   • Supports transparency: {'✅' if supports_transparency else '❌'}")
+        logger.info(f"   • Bbox fill: {fill_ratio:.2f}, edge halo: {halo_score:.2f}px, colours: ~{color_count}")
+        logger.info(f"   • Quality: {quality}")
+        
+        return report
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to analyze transparency for {icon_name}: {e}")
+        return {}
+
+
+def _bits_to_hex(bits: np.ndarray) -> str:
+    return f"{int(''.join('1' if bit else '0' for bit in bits.ravel()), 2):016x}"
+
+
+def _perceptual_hashes(image: Image.Image) -> Dict[str, str]:
+    """64-bit pHash and dHash of an icon composited over white, as hex strings.
+    
+    pHash keeps the signs of the lowest 8x8 DCT frequencies of a 32x32
+    thumbnail, dHash the horizontal gradients of a 9x8 thumbnail. Small
+    edits and re-renders of the same icon stay a few bits apart.
+    """
+    background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+    gray = Image.alpha_composite(background, image.convert('RGBA')).convert('L')
+    
+    thumbnail = np.asarray(gray.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    dhash = _bits_to_hex(thumbnail[:, 1:] > thumbnail[:, :-1])
+    
+    pixels = np.asarray(gray.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    index = np.arange(32)
+    dct = np.cos(np.pi * (2 * index[None, :] + 1) * index[:, None] / 64)
+    low_frequencies = (dct @ pixels @ dct.T)[:8, :8].ravel()
+    # The DC term only encodes overall brightness, leave it out of the median
+    phash = _bits_to_hex(low_frequencies > np.median(low_frequencies[1:]))
+    
+    return {'phash': phash, 'dhash': dhash}
+
+
+# Encoding profiles and the file extension each one produces
+ENCODING_PROFILES = {
+    'png': 'png',
+    'png-optimized': 'png',
+    'png-palette': 'png',
+    'webp-lossless': 'webp',
+    'webp': 'webp',
+    'avif': 'avif'
+}
+
+
+def _encode_with_profile(image: Image.Image, profile: str, settings: Dict[str, Any]) -> bytes:
+    """Encode an image with a named encoding profile"""
+    output = BytesIO()
+    if profile == 'png':
+        image.save(output, format='PNG')
+    elif profile == 'png-optimized':
+        image.save(output, format='PNG', optimize=True)
+    elif profile == 'png-palette':
+        # libimagequant keeps smooth alpha edges, the octree fallback only a few alpha levels
+        from PIL import features
+        method = Image.Quantize.LIBIMAGEQUANT if features.check('libimagequant') else Image.Quantize.FASTOCTREE
+        image.quantize(colors=settings.get('palette_colors', 256), method=method).save(output, format='PNG',
+                                                                                       optimize=True)
+    elif profile == 'webp-lossless':
+        # For lossless WebP quality is compression effort, past 80 it gets far slower for little gain
+        image.save(output, format='WEBP', lossless=True, quality=80, method=6)
+    elif profile == 'webp':
+        image.save(output, format='WEBP', quality=settings.get('quality', 90), alpha_quality=100, method=6)
+    elif profile == 'avif':
+        image.save(output, format='AVIF', quality=settings.get('quality', 90))
+    else:
+        raise ValueError(f"Unknown encoding profile: {profile}")
+    return output.getvalue()
+
+
+def _encode_outputs(image: Image.Image, settings: Dict[str, Any], recorder: SpanRecorder
+                    ) -> tuple[Dict[str, bytes], Dict[str, Any]]:
+    """Encode the processed image with the main PNG profile and any extra profiles.
+    
+    Returns encoded bytes keyed by file extension and a report of size, bytes
+    saved against a plain PNG and encode time per profile.
+    """
+    profiles = [settings.get('profile', 'png')] + list(settings.get('extra_profiles', []))
+    encoded = {}
+    report = {}
+    baseline_size = None
+    for profile in profiles:
+        with recorder.span('encode', profile=profile):
+            start_time = time.perf_counter()
+            try:
+                data = _encode_with_profile(image, profile, settings)
+            except (OSError, KeyError, ValueError) as e:
+                if profile == profiles[0]:
+                    raise
+                # Optional formats such as AVIF depend on how Pillow was built
+                logger.warning(f"⚠️ Skipping {profile} encoding: {e}")
+                continue
+            encode_time = time.perf_counter() - start_time
+        encoded[ENCODING_PROFILES[profile]] = data
+        if profile == 'png':
+            baseline_size = len(data)
+        report[profile] = {'bytes': len(data), 'encode_time': encode_time}
+    
+    # Savings are measured against a plain PNG, encoded only when it is not already a profile
+    if baseline_size is None and report:
+        baseline_size = len(_encode_with_profile(image, 'png', settings))
+    for stats in report.values():
+        stats['baseline_bytes'] = baseline_size
+        stats['bytes_saved'] = baseline_size - stats['bytes']
+        stats['saved_percent'] = (stats['bytes_saved'] / baseline_size * 100) if baseline_size else 0.0
+    
+    return encoded, report
+
+
+@dataclass
+class ImageStage:
+    """Named in-memory step of the post-processing pipeline.
+    
+    Transform stages return the next image. Inspect stages leave the image
+    unchanged and their return value is collected as a report.
+    """
+    name: str
+    func: Callable[[Image.Image], Any]
+    inspect: bool = False
+
+
+class ImagePipeline:
+    """Runs stages over a single decoded image and encodes it once at the end"""
+    
+    def __init__(self, stages: List[ImageStage]):
+        self.stages = stages
+    
+    @staticmethod
+    def decode(image_data: bytes) -> Image.Image:
+        """Decode image bytes into an RGBA image.
+        
+        Image.open only parses the header, so pixels are loaded here rather
+        than in whichever stage touches them first.
+        """
+        image = Image.open(BytesIO(image_data))
+        image.load()
+        return image if image.mode == 'RGBA' else image.convert('RGBA')
+    
+    @staticmethod
+    def encode(image: Image.Image, format: str = 'PNG') -> bytes:
+        """Encode image to bytes"""
+        output = BytesIO()
+        image.save(output, format=format)
+        return output.getvalue()
+    
+    def run(self, image: Image.Image, recorder: Optional[SpanRecorder] = None
+            ) -> tuple[Image.Image, List[Dict[str, Any]], Dict[str, Any]]:
+        """Run all stages, returns final image, per-stage spans and inspect reports"""
+        recorder = recorder or SpanRecorder()
+        reports = {}
+        for stage in self.stages:
+            with recorder.span(stage.name):
+                if stage.inspect:
+                    reports[stage.name] = stage.func(image)
+                else:
+                    image = stage.func(image)
+        return image, recorder.spans, reports
+
+
+def _postprocess_icon(image_data: bytes, icon_name: str, settings: Dict[str, Any]
+                      ) -> tuple[Dict[str, bytes], List[Dict[str, Any]], Dict[str, Any]]:
+    """Run the CPU-bound post-processing stage for one icon.
+    
+    Executed in a worker process, so it only takes picklable arguments.
+    The image is decoded once, passed between stages as a PIL image and
+    encoded once per configured encoding profile.
+    Returns the encoded outputs keyed by file extension ('png' is the
+    processed icon), per-step spans and the reports ('analysis', 'encoding'
+    and, when enabled, 'perceptual_hash' and 'export').
+    """
+    stages = [
+        ImageStage('background_removal', partial(_remove_background_with_rembg,
+                                                 model_name=settings['rembg_model'],
+                                                 onnx_threads=settings.get('onnx_threads'))),
+        ImageStage('crop', partial(_crop_to_content, crop_config=settings['crop'])),
+        ImageStage('analysis', partial(_analyze_transparency_quality, icon_name=icon_name), inspect=True)
+    ]
+    if settings.get('perceptual_hash'):
+        stages.append(ImageStage('perceptual_hash', _perceptual_hashes, inspect=True))
+    if settings.get('export'):
+        stages.append(ImageStage('export', partial(_export_platform_assets, asset_name=icon_name,
+                                                   settings=settings['export']), inspect=True))
+    pipeline = ImagePipeline(stages)
+    recorder = SpanRecorder()
+    
+    with recorder.span('decode'):
+        image = ImagePipeline.decode(image_data)
+    
+    image, spans, reports = pipeline.run(image, recorder)
+    
+    encoded, reports['encoding'] = _encode_outputs(image, settings.get('encoding', {}), recorder)
+    
+    return encoded, recorder.spans, reports
+
+
+class SharedRuntime:
+    """Long-lived resources shared by every generator of a process.
+    
+    Backends, hedgers and response caches are keyed on the settings that
+    configure them, so configs with matching settings share one warm client.
+    Rate limiters and API slots are keyed on backend and model only, so every
+    config calling the same model shares one request budget, sized by the
+    first config that asks for it. Worker pools keep their
+    rembg model loaded across configs and one writer serves all outputs.
+    Identical generation requests are sent once and every icon waiting on
+    them gets the same bytes.
+    """
+    
+    # ai_settings keys that configure a backend client
+    BACKEND_SETTINGS = ('backend', 'image_model', 'max_concurrency', 'http', 'synthetic',
+                        'rate_limit', 'hedging', 'request_deadline')
+    
+    def __init__(self):
+        self._backends: Dict[str, ImageBackend] = {}
+        self._rate_limiters: Dict[str, RateLimiter] = {}
+        self._hedgers: Dict[str, RequestHedger] = {}
+        self._api_slots: Dict[str, asyncio.Semaphore] = {}
+        self._response_caches: Dict[str, Optional[ResponseCache]] = {}
+        self._process_pools: Dict[tuple, ProcessPoolExecutor] = {}
+        self._writer: Optional[OutputWriter] = None
+        self._requests: Dict[str, asyncio.Future] = {}
+        self._expected: Dict[str, int] = {}
+        self.shared_requests = 0
+    
+    def _backend_key(self, ai_settings: Dict[str, Any], backend_name: Optional[str]) -> str:
+        return _fingerprint({'backend_override': backend_name,
+                             **{key: ai_settings.get(key) for key in self.BACKEND_SETTINGS}})
+    
+    def _quota_key(self, ai_settings: Dict[str, Any], backend_name: Optional[str]) -> str:
+        """Provider quotas apply per model, whatever the client tuning"""
+        backend = self.backend(ai_settings, backend_name)
+        return f"{backend.name}:{backend.model}"
+    
+    def backend(self, ai_settings: Dict[str, Any], backend_name: Optional[str] = None) -> ImageBackend:
+        key = self._backend_key(ai_settings, backend_name)
+        if key not in self._backends:
+            self._backends[key] = create_image_backend(ai_settings, backend_name)
+        return self._backends[key]
+    
+    def rate_limiter(self, ai_settings: Dict[str, Any], backend_name: Optional[str] = None) -> RateLimiter:
+        key = self._quota_key(ai_settings, backend_name)
+        if key not in self._rate_limiters:
+            self._rate_limiters[key] = RateLimiter.from_settings(ai_settings)
+        return self._rate_limiters[key]
+    
+    def hedger(self, ai_settings: Dict[str, Any], backend_name: Optional[str] = None) -> RequestHedger:
+        key = self._backend_key(ai_settings, backend_name)
+        if key not in self._hedgers:
+            self._hedgers[key] = RequestHedger.from_settings(ai_settings)
+        return self._hedgers[key]
+    
+    def api_slots(self, ai_settings: Dict[str, Any], backend_name: Optional[str] = None) -> asyncio.Semaphore:
+        """Semaphore limiting API calls in flight per model, call from inside the running loop"""
+        key = self._quota_key(ai_settings, backend_name)
+        if key not in self._api_slots:
+            self._api_slots[key] = asyncio.Semaphore(max(1, int(ai_settings.get('max_concurrency', 4))))
+        return self._api_slots[key]
+    
+    def response_cache(self, ai_settings: Dict[str, Any]) -> Optional[ResponseCache]:
+        key = _fingerprint(ai_settings.get('cache', {}))
+        if key not in self._response_caches:
+            self._response_caches[key] = ResponseCache.from_settings(ai_settings)
+        return self._response_caches[key]
+    
+    def process_pool(self, workers: int, rembg_model: str, onnx_threads: Optional[int]) -> ProcessPoolExecutor:
+        key = (workers, rembg_model, onnx_threads)
+        if key not in self._process_pools:
+            # Each worker loads the rembg model once and keeps it until the runtime closes
+            self._process_pools[key] = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_postprocess_worker,
+                initargs=(rembg_model, onnx_threads)
+            )
+            logger.info(f"Started post-processing pool with {workers} workers")
+        return self._process_pools[key]
+    
+    def writer(self, output_settings: Dict[str, Any]) -> OutputWriter:
+        """Output writer, configured by the output.writer settings of the first caller"""
+        if self._writer is None:
+            self._writer = OutputWriter.from_settings(output_settings)
+        return self._writer
+    
+    def resource_counts(self) -> Dict[str, int]:
+        return {
+            'backends': len(self._backends),
+            'rate_limiters': len(self._rate_limiters),
+            'response_caches': sum(1 for cache in self._response_caches.values() if cache is not None),
+            'process_pools': len(self._process_pools)
+        }
+    
+    def expect(self, key: str):
+        """Announce an icon that may request key, its response is kept until every announced icon is done"""
+        self._expected[key] = self._expected.get(key, 0) + 1
+    
+    def release(self, key: str):
+        """Mark one announced icon as done with key"""
+        remaining = self._expected.get(key, 0) - 1
+        if remaining > 0:
+            self._expected[key] = remaining
+            return
+        self._expected.pop(key, None)
+        future = self._requests.get(key)
+        if future is not None and future.done():
+            del self._requests[key]
+    
+    async def generate_once(self, key: str, generate: Callable[[], Awaitable[bytes]]) -> tuple[bytes, bool]:
+        """Run generate once for concurrent or announced identical requests.
+        
+        Returns the image bytes and whether they came from another icon's
+        request. When that request fails, the next waiting icon sends its own.
+        """
+        while key in self._requests:
+            image_data = await asyncio.shield(self._requests[key])
+            if image_data is not None:
+                self.shared_requests += 1
+                return image_data, True
+        
+        future = asyncio.get_running_loop().create_future()
+        self._requests[key] = future
+        try:
+            image_data = await generate()
+        except BaseException:
+            del self._requests[key]
+            future.set_result(None)
+            raise
+        future.set_result(image_data)
+        if key not in self._expected:
+            del self._requests[key]
+        return image_data, False
+    
+    async def aclose(self):
+        """Release loop-bound backend connections and stop the writer"""
+        for backend in self._backends.values():
+            await backend.aclose()
+        if self._writer is not None:
+            await self._writer.aclose()
+    
+    def close(self):
+        """Release backends, writer and worker processes"""
+        for backend in self._backends.values():
+            backend.close()
+        if self._writer is not None:
+            self._writer.close()
+        for pool in self._process_pools.values():
+            pool.shutdown(wait=True)
+        self._process_pools.clear()
+
+
+class ConfigurableIconGenerator:
+    """Main icon generator class that uses JSON configuration"""
+    
+    # Cache modes: 'use' reads and writes, 'refresh' only writes, 'bypass' ignores the cache
+    CACHE_MODES = ('use', 'refresh', 'bypass')
+    
+    # Build manifest kept in the output directory for incremental runs
+    MANIFEST_FILENAME = 'icon_manifest.json'
+    
+    # Checkpoint journal of the current run, used by --resume
+    JOURNAL_FILENAME = 'generation_journal.jsonl'
+    
+    # Output settings that do not affect post-processed files
+    POSTPROCESS_IGNORED_OUTPUT_KEYS = ('directory', 'incremental', 'processing', 'tracing', 'writer', 'atlas', 'dedup')
+    
+    def __init__(self, config_path: str, cache_mode: str = 'use', incremental: Optional[bool] = None,
+                 backend: Optional[str] = None, runtime: Optional[SharedRuntime] = None):
+        if cache_mode not in self.CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {cache_mode}")
+        self.cache_mode = cache_mode
+        self.backend_name = backend
+        
+        # Clients, pools and writer, shared with other generators when a runtime is passed in
+        self.runtime = runtime or SharedRuntime()
+        self._owns_runtime = runtime is None
+        self.config_loader = ConfigLoader()
+        self.config_data = self.config_loader.load_config(config_path)
+        self.project_config, self.icon_configs, self.generation_config = self.config_loader.parse_config(self.config_data)
+        self.prompt_builder = PromptBuilder(self.project_config, self.generation_config)
+        
+        # Initialize AI clients
+        self._setup_ai_clients()
+        
+        # Setup output directory
+        self._setup_output_directory()
+        
+        # Load build manifest from previous runs
+        if incremental is None:
+            incremental = self.generation_config.output.get('incremental', False)
+        self.incremental = incremental
+        self.manifest = self._load_manifest()
+        self.journal = RunJournal(self.output_path / self.JOURNAL_FILENAME)
+        self.writer = self.runtime.writer(self.generation_config.output)
+        
+        # Perceptual hashes of every icon generated so far, shared across projects
+        self.perceptual_index = PerceptualIndex.from_settings(self.generation_config.output)
+        
+        # Request keys announced to the runtime by plan_requests, by icon name
+        self._planned_requests: Dict[str, str] = {}
+        
+        logger.info(f"Initialized generator for project: {self.project_config.name}")
+        logger.info(f"Loaded {len(self.icon_configs)} icon configurations")
+    
+    def _setup_ai_clients(self):
+        """Setup image generation backend"""
+        ai_settings = self.generation_config.ai_settings
+        self.backend = self.runtime.backend(ai_settings, self.backend_name)
+        
+        # Model used for image generation, part of cache keys and fingerprints
+        self.image_model = self.backend.model
+        
+        # Shared rate limiter for all API calls
+        self.rate_limiter = self.runtime.rate_limiter(ai_settings, self.backend_name)
+        
+        # Tail-latency hedging, shares latency observations across icons
+        self.hedger = self.runtime.hedger(ai_settings, self.backend_name)
+        
+        # Response cache for raw image bytes
+        self.response_cache = None
+        if self.cache_mode != 'bypass':
+            self.response_cache = self.runtime.response_cache(ai_settings)
+        
+        logger.info(f"Initialized {self.backend.name} backend with model: {self.image_model}")
+        logger.info(f"Rate limit: {self.rate_limiter.requests_per_minute:.0f} requests/min (burst {self.rate_limiter.capacity})")
+    
+    def _setup_output_directory(self):
+        """Setup output directory from configuration"""
+        output_dir = self.generation_config.output.get('directory', './generated-icons')
+        self.output_path = Path(output_dir)
+        self.output_path.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Output directory: {self.output_path}")
+    
+    def _get_worker_count(self) -> int:
+        """Post-processing worker processes, 0 runs post-processing on a thread.
+        
+        Each worker loads its own rembg model, so the default stays at four
+        workers on large hosts.
+        """
+        return self.generation_config.output.get('processing', {}).get('workers', min(4, os.cpu_count() or 1))
+    
+    def _get_rembg_settings(self) -> tuple[str, Optional[int]]:
+        """Get rembg model name and ONNX thread count from output settings.
+        
+        Each worker loads its own session, so with several workers ONNX
+        defaults to one thread per session instead of every core per session.
+        """
+        output = self.generation_config.output
+        rembg_model = output.get('background_removal', {}).get('model', 'u2net')
+        onnx_threads = output.get('processing', {}).get('onnx_threads')
+        if onnx_threads is None and self._get_worker_count() > 1:
+            onnx_threads = 1
+        return rembg_model, onnx_threads
+    
+    def _get_process_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Get worker pool for post-processing, None means the default thread pool"""
+        workers = self._get_worker_count()
+        if workers <= 0:
+            return None
+        return self.runtime.process_pool(workers, *self._get_rembg_settings())
+    
+    def _get_max_pending(self, max_concurrency: int) -> int:
+        """Icons allowed in flight at once, enough to keep the API slots and every worker busy"""
+        processing = self.generation_config.output.get('processing', {})
+        workers = self._get_worker_count()
+        max_pending = processing.get('max_pending', max_concurrency + 2 * max(1, workers))
+        return max(max_concurrency, int(max_pending))
+    
+    async def aclose(self):
+        """Release loop-bound backend connections, then everything else this generator owns"""
+        if self._owns_runtime:
+            await self.runtime.aclose()
+        self.close()
+    
+    def close(self):
+        """Release the perceptual index and, unless it is shared, the runtime"""
+        if self.perceptual_index is not None:
+            self.perceptual_index.close()
+        if self._owns_runtime:
+            self.runtime.close()
+    
+    def _load_manifest(self) -> Dict[str, Any]:
+        """Load build manifest from the output directory"""
+        manifest_path = self.output_path / self.MANIFEST_FILENAME
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if isinstance(manifest.get('icons'), dict):
+                return manifest
+            logger.warning(f"Ignoring malformed manifest: {manifest_path}")
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError as e:
+            logger.warning(f"Ignoring invalid manifest {manifest_path}: {e}")
+        return {'version': 1, 'icons': {}}
+    
+    async def _write_manifest(self):
+        """Write the output manifest, the single index of every file a run produced"""
+        manifest_path = self.output_path / self.MANIFEST_FILENAME
+        self.manifest['project'] = self.project_config.name
+        self.manifest['updated_at'] = datetime.now().isoformat()
+        await self.writer.write([(manifest_path, json.dumps(self.manifest, indent=2).encode('utf-8'))])
+        logger.info(f"Manifest saved: {manifest_path}")
+    
+    def _get_effective_style(self, icon_config: IconConfig) -> Dict[str, Any]:
+        """Merge default style with icon-specific overrides"""
+        return self.prompt_builder.effective_style(icon_config)
+    
+    def _prompt_fingerprint(self, icon_config: IconConfig, prompt: str) -> str:
+        """Fingerprint of everything that determines the model output for an icon"""
+        ai_settings = self.generation_config.ai_settings
+        return _fingerprint({
+            'model': self.image_model,
+            'prompt': prompt,
+            'style': self._get_effective_style(icon_config),
+            'settings': {k: ai_settings[k] for k in ResponseCache.KEY_SETTINGS if k in ai_settings}
+        })
+    
+    def _request_key(self, prompt: str) -> str:
+        """Key of a generation request, equal for requests the backend would answer the same way"""
+        return ResponseCache.make_key(self.image_model, prompt, self.generation_config.ai_settings)
+    
+    def _style_key(self, icon_config: IconConfig) -> str:
+        """Model and effective style, icons are only reused between prompts sharing both"""
+        return _fingerprint({'model': self.image_model, 'style': self._get_effective_style(icon_config)})
+    
+    def _postprocess_fingerprint(self) -> str:
+        """Fingerprint of the output settings that determine post-processed files"""
+        return _fingerprint({
+            'output': {k: v for k, v in self.generation_config.output.items()
+                       if k not in self.POSTPROCESS_IGNORED_OUTPUT_KEYS},
+            'target_platforms': self.project_config.target_platforms
+        })
+    
+    def _incremental_status(self, icon_name: str, prompt_fingerprint: str) -> str:
+        """Compare an icon against the manifest.
+        
+        Returns 'up_to_date' when nothing changed, 'reprocess' when only
+        post-processing settings changed and 'stale' when it must be regenerated.
+        """
+        entry = self.manifest['icons'].get(icon_name)
+        if not entry or entry.get('prompt_fingerprint') != prompt_fingerprint:
+            return 'stale'
+        
+        files = entry.get('files', {})
+        if not files.get('original') or not (self.output_path / files['original']).exists():
+            return 'stale'
+        
+        if entry.get('postprocess_fingerprint') != self._postprocess_fingerprint():
+            return 'reprocess'
+        if not all((self.output_path / files[key]).exists() for key in ('processed', 'metadata') if key in files):
+            return 'reprocess'
+        return 'up_to_date'
+    
+    def _up_to_date_result(self, icon_config: IconConfig) -> IconResult:
+        """Build result for an icon that is skipped because it is up to date"""
+        entry = self.manifest['icons'][icon_config.name]
+        metadata = {}
+        try:
+            with open(self.output_path / entry['files']['metadata'], 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (KeyError, OSError, json.JSONDecodeError):
+            metadata = {
+                'display_name': icon_config.display_name,
+                'description': icon_config.description,
+                'category': icon_config.category,
+                'keywords': icon_config.keywords
+            }
+        metadata['build_status'] = 'up_to_date'
+        
+        logger.info(f"⏭️ Icon up to date, skipping: {icon_config.name}")
+        return IconResult(name=icon_config.name, metadata=metadata, generation_time=0.0)
+    
+    def _create_generation_prompt(self, icon_config: IconConfig) -> str:
+        """Create generation prompt from template and icon config"""
+        return self.prompt_builder.build(icon_config)
+    
+    async def _call_backend(self, prompt: str, retry_stats: Dict[str, Any], attributes: Dict[str, Any]) -> bytes:
+        """Make one API attempt within ai_settings.request_deadline.
+        
+        A call still running past the hedger's latency percentile gets a duplicate
+        request when an API slot and a rate-limit token are free, so hedges stay
+        within max_concurrency. The first successful response wins and the other
+        request is cancelled.
+        """
+        deadline = self.generation_config.ai_settings.get('request_deadline')
+        api_slots = self.runtime.api_slots(self.generation_config.ai_settings, self.backend_name)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        hedge_delay = self.hedger.delay()
+        self.hedger.calls += 1
+        
+        # Request task -> (start time, is hedge)
+        tasks = {asyncio.ensure_future(self.backend.generate(prompt)): (started, False)}
+        try:
+            while True:
+                elapsed = loop.time() - started
+                timeouts = [limit - elapsed for limit in (deadline, hedge_delay) if limit is not None]
+                done, _ = await asyncio.wait(tasks, timeout=max(0.0, min(timeouts)) if timeouts else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task_started, is_hedge = tasks.pop(task)
+                    if task.exception() is None:
+                        self.hedger.record_latency(loop.time() - task_started)
+                        if is_hedge:
+                            retry_stats['hedge_wins'] += 1
+                            attributes['hedge_won'] = True
+                        return task.result()
+                    if not tasks:
+                        raise task.exception()
+                if done:
+                    # One request failed while another is still running
+                    continue
+                
+                elapsed = loop.time() - started
+                if deadline is not None and elapsed >= deadline:
+                    retry_stats['timeouts'] += 1
+                    attributes['timed_out'] = True
+                    raise TimeoutError(f"No response within the {deadline}s request deadline")
+                if hedge_delay is not None and elapsed >= hedge_delay:
+                    hedge_delay = None
+                    # The original request holds its own slot, the hedge needs a second one
+                    if not api_slots.locked() and self.rate_limiter.try_acquire():
+                        await api_slots.acquire()
+                        hedge = asyncio.ensure_future(self.backend.generate(prompt))
+                        hedge.add_done_callback(lambda _: api_slots.release())
+                        tasks[hedge] = (loop.time(), True)
+                        self.hedger.hedges += 1
+                        retry_stats['hedges'] += 1
+                        attributes['hedged'] = True
+                        logger.info(f"🪂 Hedging request still running after {elapsed:.1f}s")
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Let cancelled requests finish their cleanup and retrieve their errors
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _generate_image_with_retries(self, prompt: str, retry_stats: Dict[str, Any],
+                                           recorder: SpanRecorder) -> bytes:
+        """Call the image backend through the rate limiter, retrying transient errors
+        with jittered exponential backoff"""
+        ai_settings = self.generation_config.ai_settings
+        rate_limit = ai_settings.get('rate_limit', {})
+        max_retries = ai_settings.get('max_retries', 3)
+        
+        # Created inside the running loop, limits API calls in flight
+        api_slots = self.runtime.api_slots(ai_settings, self.backend_name)
+        backoff_base = rate_limit.get('backoff_base', 2.0)
+        backoff_max = rate_limit.get('backoff_max', 60.0)
+        
+        attempt = 0
+        while True:
+            try:
+                queued_at = time.time()
+                queued = time.perf_counter()
+                async with api_slots:
+                    recorder.add('api_queue', queued_at, time.perf_counter() - queued)
+                    with recorder.span('rate_limit_wait'):
+                        retry_stats['wait_time'] += await self.rate_limiter.acquire()
+                    with recorder.span('api_call', attempt=attempt + 1) as attributes:
+                        image_data = await self._call_backend(prompt, retry_stats, attributes)
+                self.rate_limiter.on_success()
+                return image_data
+            except Exception as e:
+                if _is_quota_error(e):
+                    self.rate_limiter.on_quota_error()
+                if attempt >= max_retries or not _is_retryable_error(e):
+                    raise
+                
+                # Full jitter: sleep a random amount up to the exponential cap
+                delay = random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+                attempt += 1
+                retry_stats['retries'] = attempt
+                logger.warning(f"🔁 Retry {attempt}/{max_retries} in {delay:.1f}s after error: {e}")
+                with recorder.span('retry_backoff', attempt=attempt):
+                    await asyncio.sleep(delay)
+                retry_stats['wait_time'] += delay
+    
+    async def generate_single_icon(self, icon_config: IconConfig) -> IconResult:
+        """Generate a single icon using the configured image backend"""
+        start_time = time.time()
+        retry_stats = {'retries': 0, 'wait_time': 0.0, 'hedges': 0, 'hedge_wins': 0, 'timeouts': 0}
+        recorder = SpanRecorder()
+        
+        try:
+            # Create generation prompt for image generation
+            with recorder.span('prompt_build'):
+                prompt = self._create_generation_prompt(icon_config)
+                prompt_fingerprint = self._prompt_fingerprint(icon_config, prompt)
+                prompt_simhash = f"{_simhash(self.prompt_builder.subject_features(icon_config)):016x}"
+            image_data = None
+            build_status = 'generated'
+            
+            # Skip or re-derive icons that are unchanged since the last run
+            if self.incremental:
+                status = self._incremental_status(icon_config.name, prompt_fingerprint)
+                if status == 'up_to_date':
+                    result = self._up_to_date_result(icon_config)
+                    result.spans = recorder.spans
+                    return result
+                if status == 'reprocess':
+                    original_file = self.manifest['icons'][icon_config.name]['files']['original']
+                    with recorder.span('read_original'):
+                        image_data = (self.output_path / original_file).read_bytes()
+                    build_status = 'reprocessed'
+                    logger.info(f"♻️ Re-processing icon from saved original: {icon_config.name}")
+            
+            if image_data is None:
+                logger.info(f"Generating icon: {icon_config.name}")
+            logger.debug(f"Prompt: {prompt}")
+            
+            # Look up previously generated image for the same request
+            request_key = self._request_key(prompt)
+            cache_hit = False
+            shared_request = False
+            reuse_match = None
+            if image_data is None and self.response_cache:
+                if self.cache_mode == 'use':
+                    with recorder.span('cache_lookup') as attributes:
+                        image_data = self.response_cache.get(request_key)
+                        cache_hit = attributes['hit'] = image_data is not None
+            
+            if cache_hit:
+                logger.info(f"💾 Cache hit for icon: {icon_config.name}")
+            elif image_data is None and self.perceptual_index is not None and self.perceptual_index.reuse != 'off':
+                # Look for an icon generated earlier, possibly by another project, from a near-identical prompt
+                with recorder.span('index_lookup', kind='prompt') as attributes:
+                    reuse_match = self.perceptual_index.find_similar_prompt(
+                        prompt_simhash, self._style_key(icon_config), (self.project_config.name, icon_config.name))
+                    attributes['hit'] = reuse_match is not None
+                if reuse_match and self.perceptual_index.reuse == 'auto':
+                    with recorder.span('read_original'):
+                        image_data = Path(reuse_match['original_path']).read_bytes()
+                    build_status = 'reused'
+                    logger.info(f"🔁 Reusing {reuse_match['project']}/{reuse_match['name']} for icon: "
+                                f"{icon_config.name} (prompt distance {reuse_match['distance']})")
+                elif reuse_match:
+                    logger.info(f"💡 {icon_config.name} looks like {reuse_match['project']}/{reuse_match['name']} "
+                                f"(prompt distance {reuse_match['distance']}), set output.dedup.reuse to 'auto' to reuse it")
+            
+            if image_data is None:
+                # Generate image using the configured backend, identical requests of other icons are sent once
+                image_data, shared_request = await self.runtime.generate_once(
+                    request_key, lambda: self._generate_image_with_retries(prompt, retry_stats, recorder))
+                
+                if self.response_cache and not shared_request:
+                    self.response_cache.put(request_key, image_data)
+            
+            # Calculate generation time
+            generation_time = time.time() - start_time
+            
+            # Create result with PNG data only
+            result = IconResult(
+                name=icon_config.name,
+                metadata={
+                    'display_name': icon_config.display_name,
+                    'description': icon_config.description,
+                    'category': icon_config.category,
+                    'keywords': icon_config.keywords,
+                    'style': self.generation_config.style,
+                    'generation_time': generation_time,
+                    'model_used': self.image_model,
+                    'prompt': prompt,
+                    'format': 'PNG',
+                    'generation_method': self.backend.generation_method,
+                    'retries': retry_stats['retries'],
+                    'wait_time': retry_stats['wait_time'],
+                    'hedges': retry_stats['hedges'],
+                    'hedge_wins': retry_stats['hedge_wins'],
+                    'timeouts': retry_stats['timeouts'],
+                    'cache_hit': cache_hit,
+                    'shared_request': shared_request,
+                    'build_status': build_status,
+                    'prompt_fingerprint': prompt_fingerprint,
+                    'prompt_simhash': prompt_simhash,
+                    'reuse_match': reuse_match,
+                    'timestamp': datetime.now().isoformat()
+                },
+                generation_time=generation_time,
+                spans=recorder.spans
+            )
+            
+            # Save icon and record it in the build manifest
+            saved_files = await self._save_icon(result, image_data)
+            self.manifest['icons'][icon_config.name] = {
+                'prompt_fingerprint': prompt_fingerprint,
+                'postprocess_fingerprint': self._postprocess_fingerprint(),
+                'files': saved_files,
+                'processed_sha256': result.metadata.get('processed_sha256'),
+                'exports': result.metadata.get('exports', []),
+                'updated_at': datetime.now().isoformat()
+            }
+            if self.perceptual_index is not None and 'perceptual_hash' in result.metadata:
+                self.perceptual_index.add(
+                    self.project_config.name, icon_config.name, self.journal.run_id, self._style_key(icon_config),
+                    prompt_simhash, **result.metadata['perceptual_hash'],
+                    original_path=self.output_path / saved_files['original'],
+                    processed_path=self.output_path / saved_files['processed'])
+            
+            logger.info(f"Successfully generated PNG icon: {icon_config.name} ({generation_time:.2f}s)")
+            return result
+            
+        except Exception as e:
+            generation_time = time.time() - start_time
+            error_msg = f"Failed to generate icon {icon_config.name}: {str(e)}"
+            logger.error(error_msg)
+            
+            return IconResult(
+                name=icon_config.name,
+                metadata={
+                    'display_name': icon_config.display_name,
+                    'description': icon_config.description,
+                    'category': icon_config.category,
+                    'keywords': icon_config.keywords,
+                    'error': error_msg,
+                    'generation_method': self.backend.generation_method,
+                    'retries': retry_stats['retries'],
+                    'wait_time': retry_stats['wait_time'],
+                    'hedges': retry_stats['hedges'],
+                    'hedge_wins': retry_stats['hedge_wins'],
+                    'timeouts': retry_stats['timeouts']
+                },
+                generation_time=generation_time,
+                success=False,
+                error=error_msg,
+                spans=recorder.spans
+            )
+        
+        finally:
+            request_key = self._planned_requests.pop(icon_config.name, None)
+            if request_key:
+                self.runtime.release(request_key)
+    
+
+    
+    def _get_export_settings(self) -> Optional[Dict[str, Any]]:
+        """Resolve platform export settings, None when export is disabled"""
+        export = self.generation_config.output.get('export', {})
+        if not export.get('enabled', False):
+            return None
+        
+        brand_colors = self.project_config.brand_colors
+        encoding = self._get_encoding_settings()
+        return {
+            'platforms': export.get('platforms') or self.project_config.target_platforms,
+            'directory': str(self.output_path / export.get('directory', 'exports')),
+            'asset_type': export.get('asset_type', 'app_icon'),
+            'base_size': export.get('base_size', 24),
+            'background_color': export.get('background_color', brand_colors[0] if brand_colors else '#FFFFFF'),
+            'png_profile': encoding['profile'],
+            'palette_colors': encoding['palette_colors']
+        }
+    
+    def _get_encoding_settings(self) -> Dict[str, Any]:
+        """Resolve output.encoding, the PNG profile of the processed icon plus extra formats"""
+        encoding = self.generation_config.output.get('encoding', {})
+        profile = encoding.get('profile', 'png')
+        extra_profiles = list(encoding.get('extra_profiles', []))
+        if ENCODING_PROFILES.get(profile) != 'png':
+            raise ValueError(f"Encoding profile for the processed PNG must be a PNG profile, got: {profile}")
+        extensions = [ENCODING_PROFILES.get(extra) for extra in extra_profiles]
+        if None in extensions or 'png' in extensions or len(set(extensions)) != len(extensions):
+            raise ValueError(f"Extra encoding profiles must be distinct non-PNG formats, got: {extra_profiles}")
+        return {
+            'profile': profile,
+            'extra_profiles': extra_profiles,
+            'quality': encoding.get('quality', 90),
+            'palette_colors': encoding.get('palette_colors', 256)
+        }
+    
+    def _get_postprocess_settings(self) -> Dict[str, Any]:
+        """Collect picklable settings for the post-processing stage"""
+        rembg_model, onnx_threads = self._get_rembg_settings()
+        return {
+            'crop': self.generation_config.output.get('crop', {}),
+            'rembg_model': rembg_model,
+            'onnx_threads': onnx_threads,
+            'encoding': self._get_encoding_settings(),
+            'perceptual_hash': self.perceptual_index is not None,
+            'export': self._get_export_settings()
+        }
+    
+    async def _run_postprocessing(self, image_data: bytes, icon_name: str
+                                  ) -> tuple[Dict[str, bytes], List[Dict[str, Any]], Dict[str, Any]]:
+        """Run post-processing stage in the worker pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_process_pool(), _postprocess_icon,
+                                          image_data, icon_name, self._get_postprocess_settings())
+    
+    def _get_atlas_settings(self) -> Optional[Dict[str, Any]]:
+        """Resolve atlas packing settings, None when packing is disabled"""
+        atlas = self.generation_config.output.get('atlas', {})
+        if not atlas.get('enabled', False):
+            return None
+        
+        encoding = self._get_encoding_settings()
+        return {
+            'name': atlas.get('name', 'icons'),
+            'directory': str(self.output_path / atlas.get('directory', 'atlases')),
+            'scales': atlas.get('scales', [1, 2, 3]),
+            'base_size': atlas.get('base_size', 32),
+            'max_size': atlas.get('max_size', 2048),
+            'padding': atlas.get('padding', 2),
+            'power_of_two': atlas.get('power_of_two', False),
+            'formats': atlas.get('formats', ['json']),
+            'png_profile': encoding['profile'],
+            'palette_colors': encoding['palette_colors']
+        }
+    
+    async def _build_atlases(self) -> Optional[Dict[str, Any]]:
+        """Pack the processed icons of every configured icon into atlases per density.
+        
+        Processed icons are already cropped to content, so sprites pack tightly.
+        Runs in the worker pool and records the written files in the manifest.
+        """
+        settings = self._get_atlas_settings()
+        if settings is None:
+            return None
+        
+        icon_paths = {}
+        for icon_config in self.icon_configs:
+            entry = self.manifest['icons'].get(icon_config.name)
+            if entry and (self.output_path / entry['files']['processed']).exists():
+                icon_paths[icon_config.name] = str(self.output_path / entry['files']['processed'])
+        if not icon_paths:
+            return None
+        
+        import icon_atlas
+        loop = asyncio.get_running_loop()
+        try:
+            report = await loop.run_in_executor(self._get_process_pool(), icon_atlas.build_atlases,
+                                                icon_paths, settings['directory'], settings)
+        except Exception as e:
+            logger.error(f"❌ Atlas packing failed: {e}")
+            return {'error': str(e)}
+        
+        atlas_dir = Path(settings['directory']).relative_to(self.output_path)
+        self.manifest['atlases'] = {density: [str(atlas_dir / name) for name in stats['files']]
+                                    for density, stats in report['densities'].items()}
+        return report
+    
+    def _find_near_duplicates(self, result: IconResult) -> List[Dict[str, Any]]:
+        """Indexed icons that look like the processed icon, flagging the ones from this run"""
+        with SpanRecorder(result.spans).span('index_lookup', kind='image'):
+            matches = self.perceptual_index.find_similar_images(
+                **result.metadata['perceptual_hash'], exclude=(self.project_config.name, result.name))
+        near_duplicates = []
+        for match in matches:
+            run_id = match.pop('run_id')
+            same_run = run_id is not None and run_id == self.journal.run_id
+            near_duplicates.append({**match, 'same_run': same_run})
+            if same_run:
+                logger.warning(f"⚠️ {result.name} is a near-duplicate of {match['name']} generated in this run "
+                               f"(hash distance {match['distance']})")
+        if near_duplicates and not near_duplicates[0]['same_run']:
+            closest = near_duplicates[0]
+            logger.info(f"🔎 {result.name} resembles {closest['project']}/{closest['name']} "
+                        f"(hash distance {closest['distance']})")
+        return near_duplicates
+    
+    async def _save_icon(self, result: IconResult, image_data: Optional[bytes]) -> Dict[str, str]:
+        """Save generated PNG icon to file (NO SVG)
+        
+        The image bytes are passed separately so the result stays a lightweight
+        record. Returns the saved filenames relative to the output directory,
+        errors are logged and re-raised so the icon is reported as failed.
+        """
+        try:
+            # Get filename pattern
+            filename_pattern = self.generation_config.output.get('filename_pattern', '{name}')
+            filename = PromptTemplate.process_template(filename_pattern, 
+                                                     name=result.name, 
+                                                     timestamp=datetime.now().strftime('%Y%m%d_%H%M%S'))
+            
+            # Save PNG file ONLY
+            png_path = self.output_path / f"{filename}.png"
+            
+            # Save PNG file if image data exists
+            if image_data:
+                logger.info(f"Saving PNG file: {png_path}")
+                logger.debug(f"Image data type: {type(image_data)}")
+                
+                # Image data should be bytes from Gemini API
+                if isinstance(image_data, bytes):
+                    # Remove background and crop off the event loop
+                    encoded, spans, reports = await self._run_postprocessing(image_data, result.name)
+                    cropped_image_data = encoded.pop('png')
+                    result.spans.extend(spans)
+                    timings = {}
+                    for span in spans:
+                        timings[span['stage']] = timings.get(span['stage'], 0.0) + span['duration']
+                    result.metadata['background_removal_model'] = self._get_rembg_settings()[0]
+                    result.metadata['timings'] = timings
+                    result.metadata['quality'] = reports['analysis']
+                    result.metadata['encoding'] = reports['encoding']
+                    if 'export' in reports:
+                        result.metadata['exports'] = reports['export']
+                    if 'perceptual_hash' in reports:
+                        result.metadata['perceptual_hash'] = reports['perceptual_hash']
+                        result.metadata['near_duplicates'] = self._find_near_duplicates(result)
+                    logger.info(f"⏱️ Background removal for {result.name}: {timings['background_removal']:.2f}s")
+                    
+                else:
+                    logger.error(f"❌ Invalid image data type: {type(image_data)}")
+                    raise ValueError(f"Expected bytes, got {type(image_data)}")
+            else:
+                logger.error("❌ No image data to save")
+                raise ValueError("No image data to save")
+            
+            original_path = self.output_path / f"{filename}_original.png"
+            metadata_path = self.output_path / f"{filename}.json"
+            result.metadata['processed_sha256'] = hashlib.sha256(cropped_image_data).hexdigest()
+            
+            variant_paths = {extension: self.output_path / f"{filename}.{extension}" for extension in encoded}
+            
+            # Original, processed image, extra formats, then metadata sidecar, each renamed into place in that order
+            with SpanRecorder(result.spans).span('write'):
+                await self.writer.write([
+                    (original_path, image_data),
+                    (png_path, cropped_image_data),
+                    *((variant_paths[extension], data) for extension, data in encoded.items()),
+                    (metadata_path, json.dumps(result.metadata, indent=2).encode('utf-8'))
+                ])
+            logger.info(f"✅ Original PNG saved: {original_path}")
+            logger.info(f"✅ Processed PNG saved: {png_path}")
+            
+            logger.info(f"Saved icon: {png_path}")
+            
+            return {
+                'original': original_path.name,
+                'processed': png_path.name,
+                **{extension: path.name for extension, path in variant_paths.items()},
+                'metadata': metadata_path.name
+            }
+            
+        except Exception as e:
+            logger.error(f"Failed to save icon {result.name}: {e}")
+            raise
+    
+    def plan_requests(self) -> List[str]:
+        """Announce the request of every icon this run may send to the runtime.
+        
+        The runtime then keeps each response until every icon announcing the
+        same request is done, so identical prompts in other configs of a batch
+        share one API call. Returns the announced request keys.
+        """
+        for icon_config in self.icon_configs:
+            prompt = self._create_generation_prompt(icon_config)
+            if self.incremental:
+                status = self._incremental_status(icon_config.name, self._prompt_fingerprint(icon_config, prompt))
+                if status != 'stale':
+                    continue
+            request_key = self._request_key(prompt)
+            self._planned_requests[icon_config.name] = request_key
+            self.runtime.expect(request_key)
+        return list(self._planned_requests.values())
+    
+    def changed_icons(self) -> List[IconConfig]:
+        """Icons whose prompt, effective style or post-processing settings differ from the manifest"""
+        changed = []
+        for icon_config in self.icon_configs:
+            prompt = self._create_generation_prompt(icon_config)
+            if self._incremental_status(icon_config.name, self._prompt_fingerprint(icon_config, prompt)) != 'up_to_date':
+                changed.append(icon_config)
+        return changed
+    
+    async def warm_up(self):
+        """Start every post-processing worker so each has its rembg model loaded before the first icon"""
+        pool = self._get_process_pool()
+        if pool is None:
+            return
+        workers = self._get_worker_count()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(pool, os.getpid) for _ in range(workers)))
+    
+    async def update_icons(self, icon_configs: List[IconConfig],
+                           on_result: Optional[Callable[[IconResult], None]] = None) -> List[IconResult]:
+        """Generate the given icons, then refresh atlases and the manifest.
+        
+        Used by watch mode for the icons changed by a save, so it keeps no
+        journal and writes no report. Each update still gets its own run id
+        for the perceptual index. on_result is called as each icon's files
+        land on disk.
+        """
+        self.journal.run_id = f"update_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        max_concurrency = max(1, int(self.generation_config.ai_settings.get('max_concurrency', 4)))
+        pending_slots = asyncio.Semaphore(self._get_max_pending(max_concurrency))
+        
+        async def generate(icon_config: IconConfig) -> IconResult:
+            async with pending_slots:
+                result = await self.generate_single_icon(icon_config)
+            if on_result:
+                on_result(result)
+            return result
+        
+        results = await asyncio.gather(*(generate(icon_config) for icon_config in icon_configs))
+        await self.write_outputs()
+        return list(results)
+    
+    async def write_outputs(self) -> Optional[Dict[str, Any]]:
+        """Pack atlases and write the manifest for icons generated outside generate_all_icons.
+        
+        Returns the atlas report, None when atlas packing is disabled.
+        """
+        atlas_report = await self._build_atlases()
+        await self._write_manifest()
+        return atlas_report
+    
+    def _pending_icons(self, completed: Dict[str, Dict[str, Any]]) -> List[IconConfig]:
+        """Icons a resumed run still has to generate: pending, failed or changed since journaled"""
+        pending = []
+        for icon_config in self.icon_configs:
+            event = completed.get(icon_config.name)
+            # Icons journaled without a manifest entry have no files on disk
+            if event and event['success'] and event.get('manifest_entry'):
+                prompt = self._create_generation_prompt(icon_config)
+                journaled_fingerprint = event['metadata'].get('prompt_fingerprint')
+                if journaled_fingerprint == self._prompt_fingerprint(icon_config, prompt):
+                    # Restore manifest entry in case the interrupted run never wrote it
+                    self.manifest['icons'][icon_config.name] = event['manifest_entry']
+                    continue
+            pending.append(icon_config)
+        return pending
+    
+    async def generate_all_icons(self, resume: bool = False) -> List[IconResult]:
+        """Generate all icons from configuration.
+        
+        API calls are bounded by ai_settings.max_concurrency while post-processing
+        runs concurrently in the worker pool, so the two stages overlap. At most
+        output.processing.max_pending icons hold image buffers at once, each is
+        released after its files are written. Results are journaled as they
+        complete and the returned list and report are built from the journal, so
+        memory stays flat with catalog size and with resume=True only pending or
+        failed icons are generated.
+        """
+        max_concurrency = max(1, int(self.generation_config.ai_settings.get('max_concurrency', 4)))
+        max_pending = self._get_max_pending(max_concurrency)
+        pending_slots = asyncio.Semaphore(max_pending)
+        
+        icon_configs = self.icon_configs
+        resumed = self.journal.start(self.project_config.name, [c.name for c in icon_configs], resume=resume)
+        if resumed:
+            icon_configs = self._pending_icons(self.journal.completed())
+            logger.info(f"{len(self.icon_configs) - len(icon_configs)} icons already completed in journal")
+        
+        logger.info(f"Starting generation of {len(icon_configs)} icons "
+                    f"(concurrency: {max_concurrency}, max pending: {max_pending})")
+        
+        async def generate_and_record(icon_config: IconConfig):
+            async with pending_slots:
+                result = await self.generate_single_icon(icon_config)
+            manifest_entry = self.manifest['icons'].get(icon_config.name) if result.success else None
+            self.journal.record(result, manifest_entry)
+        
+        await asyncio.gather(*(generate_and_record(icon_config) for icon_config in icon_configs))
+        
+        # Planned icons a resumed run skipped never requested their keys
+        for request_key in self._planned_requests.values():
+            self.runtime.release(request_key)
+        self._planned_requests.clear()
+        
+        atlas_report = await self._build_atlases()
+        await self._write_manifest()
+        
+        # Build results in config order from the journal
+        completed = self.journal.completed()
+        results = [RunJournal.to_result(completed[c.name]) for c in self.icon_configs if c.name in completed]
+        
+        # Generate summary report and trace exports
+        self._generate_summary_report(results, atlas_report)
+        
+        return results
+    
+    def _generate_summary_report(self, results: List[IconResult], atlas_report: Optional[Dict[str, Any]] = None,
+                                 workers: Optional[Dict[str, Dict[str, Any]]] = None) -> Path:
+        """Generate summary report of generation session, workers breaks down a distributed run"""
+        successful = [r for r in results if r.success]
+        failed = [r for r in results if not r.success]
+        skipped = [r for r in successful if r.metadata.get('build_status') == 'up_to_date']
+        
+        total_time = sum(r.generation_time for r in results)
+        avg_time = total_time / len(results) if results else 0
+        
+        background_removal_times = [r.metadata['timings']['background_removal']
+                                    for r in successful if 'timings' in r.metadata]
+        
+        stage_histograms = _aggregate_stage_spans(results)
+        
+        report = {
+            'project': self.project_config.name,
+            'timestamp': datetime.now().isoformat(),
+            'summary': {
+                'total_icons': len(results),
+                'successful': len(successful),
+                'failed': len(failed),
+                'skipped': len(skipped),
+                'success_rate': len(successful) / len(results) * 100 if results else 0,
+                'total_time': total_time,
+                'average_time': avg_time,
+                'average_background_removal_time': (sum(background_removal_times) / len(background_removal_times)
+                                                    if background_removal_times else 0)
+            },
+            'successful_icons': [r.name for r in successful],
+            'background_removal_times': {r.name: r.metadata['timings']['background_removal']
+                                         for r in successful if 'timings' in r.metadata},
+            'failed_icons': [{'name': r.name, 'error': r.error} for r in failed],
+            'encoding': self._encoding_summary(successful),
+            'atlases': atlas_report,
+            'duplicates': self._duplicates_summary(successful),
+            'tail_latency': self._tail_latency_summary(results, stage_histograms),
+            'stage_histograms': stage_histograms
+        }
+        if workers is not None:
+            report['workers'] = workers
         
         # Save report
-        report_path = self.output_path / f"generation_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        report_path = self.output_path / f"generation_report_{timestamp}.json"
         with open(report_path, 'w', encoding='utf-8') as f:
             json.dump(report, f, indent=2)
         
         logger.info(f"Generation complete: {len(successful)}/{len(results)} successful")
         logger.info(f"Report saved: {report_path}")
+        
+        self._export_traces(results, stage_histograms, timestamp)
+        return report_path
+    
+    def _encoding_summary(self, results: List[IconResult]) -> Dict[str, Dict[str, Any]]:
+        """Bytes and encode time per encoding profile, totalled over icons"""
+        summary = {}
+        for result in results:
+            for profile, stats in result.metadata.get('encoding', {}).items():
+                totals = summary.setdefault(profile, {'icons': 0, 'bytes': 0, 'baseline_bytes': 0, 'encode_time': 0.0})
+                totals['icons'] += 1
+                totals['bytes'] += stats['bytes']
+                totals['baseline_bytes'] += stats['baseline_bytes']
+                totals['encode_time'] += stats['encode_time']
+        for totals in summary.values():
+            totals['bytes_saved'] = totals['baseline_bytes'] - totals['bytes']
+            totals['saved_percent'] = (totals['bytes_saved'] / totals['baseline_bytes'] * 100
+                                       if totals['baseline_bytes'] else 0.0)
+            totals['average_encode_time'] = totals['encode_time'] / totals['icons']
+        return summary
+    
+    def _duplicates_summary(self, results: List[IconResult]) -> Optional[Dict[str, Any]]:
+        """Reused icons, reuse suggestions and near-duplicate icons found through the perceptual index"""
+        if self.perceptual_index is None:
+            return None
+        
+        summary = {
+            'index_path': str(self.perceptual_index.path),
+            'index_entries': len(self.perceptual_index),
+            'reuse_mode': self.perceptual_index.reuse,
+            'reused': [],
+            'reuse_candidates': [],
+            'near_duplicates_in_run': [],
+            'near_duplicates_indexed': []
+        }
+        for result in results:
+            match = result.metadata.get('reuse_match')
+            if match:
+                kind = 'reused' if result.metadata.get('build_status') == 'reused' else 'reuse_candidates'
+                summary[kind].append({'icon': result.name, 'match': f"{match['project']}/{match['name']}",
+                                      'prompt_distance': match['distance']})
+            for duplicate in result.metadata.get('near_duplicates', []):
+                kind = 'near_duplicates_in_run' if duplicate['same_run'] else 'near_duplicates_indexed'
+                summary[kind].append({'icon': result.name, 'match': f"{duplicate['project']}/{duplicate['name']}",
+                                      'distance': duplicate['distance']})
+        return summary
+    
+    def _tail_latency_summary(self, results: List[IconResult],
+                              stage_histograms: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Deadline and hedging settings with the timeouts and hedges they caused"""
+        ai_settings = self.generation_config.ai_settings
+        api_call = stage_histograms.get('api_call', {})
+        hedges = sum(r.metadata.get('hedges', 0) for r in results)
+        return {
+            'request_deadline': ai_settings.get('request_deadline'),
+            'hedging_enabled': self.hedger.enabled,
+            'hedge_percentile': self.hedger.percentile,
+            'hedge_delay': self.hedger.delay() if self.hedger.enabled else None,
+            'api_calls': api_call.get('count', 0),
+            'api_call_p50': api_call.get('p50'),
+            'api_call_p95': api_call.get('p95'),
+            'api_call_max': api_call.get('max'),
+            'timeouts': sum(r.metadata.get('timeouts', 0) for r in results),
+            'hedges': hedges,
+            'hedge_wins': sum(r.metadata.get('hedge_wins', 0) for r in results),
+            'hedge_win_rate': (sum(r.metadata.get('hedge_wins', 0) for r in results) / hedges) if hedges else 0
+        }
+    
+    def _export_traces(self, results: List[IconResult], stage_histograms: Dict[str, Dict[str, Any]],
+                       timestamp: str):
+        """Write per-icon spans as JSONL traces and stage histograms as Prometheus text metrics"""
+        tracing = self.generation_config.output.get('tracing', {})
+        if not tracing.get('enabled', True):
+            return
+        
+        traces_path = self.output_path / f"generation_traces_{timestamp}.jsonl"
+        with open(traces_path, 'w', encoding='utf-8') as f:
+            for result in results:
+                for span in result.spans:
+                    f.write(json.dumps({'run_id': self.journal.run_id, 'icon': result.name, **span}) + '\n')
+        
+        # Fixed name so a textfile collector always scrapes the latest run
+        metrics_path = self.output_path / tracing.get('metrics_file', 'generation_metrics.prom')
+        tmp_path = metrics_path.with_name(metrics_path.name + '.tmp')
+        tmp_path.write_text(_format_prometheus_metrics(self.project_config.name, stage_histograms, results),
+                            encoding='utf-8')
+        os.replace(tmp_path, metrics_path)
+        
+        slowest = sorted(stage_histograms.items(), key=lambda item: item[1]['sum'], reverse=True)[:3]
+        if slowest:
+            breakdown = ', '.join(f"{stage} {stats['share_of_traced_time'] * 100:.0f}%" for stage, stats in slowest)
+            logger.info(f"📈 Stage time breakdown: {breakdown}")
+        logger.info(f"Traces saved: {traces_path}, metrics: {metrics_path}")
 
-async def main():
-    """Main function"""
-    import sys
+def configure_logging(verbose: bool = True, log_file: Optional[str] = 'icon_generation.log'):
+    """Configure root logging, called once the command line is parsed"""
+    handlers: List[logging.Handler] = [logging.StreamHandler()]
+    if log_file:
+        handlers.insert(0, logging.FileHandler(log_file))
+    logging.basicConfig(
+        level=logging.DEBUG if verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=handlers
+    )
     
-    if len(sys.argv) < 2:
-        print("Usage: python icon_generator_v2.py <config_file.json>")
-        print("Example: python icon_generator_v2.py health-app-icons.config.json")
-        return 1
     
-    config_file = sys.argv[1]
+def validate_configs(config_paths: List[str], schema_path: Optional[str] = None) -> int:
+    """Check configurations against the schema and for unresolved prompts, returns the failure count"""
+    config_loader = ConfigLoader(schema_path)
+    failures = 0
+    for config_path in config_paths:
+        try:
+            with open(config_path, 'r', encoding='utf-8') as f:
+                config_data = json.load(f)
+            problems = config_loader.validation_errors(config_data) or config_loader.check_config(config_data)
+        except (OSError, json.JSONDecodeError) as e:
+            problems = [str(e)]
+        
+        if problems:
+            failures += 1
+            print(f"❌ {config_path}")
+            for problem in problems:
+                print(f"   • {problem}")
+        else:
+            print(f"✅ {config_path}")
+    return failures
+
+
+def print_prompts(config_path: str, icon_names: Optional[List[str]] = None, as_json: bool = False):
+    """Print the resolved generation prompt of each icon without contacting the backend"""
+    config_loader = ConfigLoader()
+    project_config, icon_configs, generation_config = config_loader.parse_config(config_loader.load_config(config_path))
+    prompt_builder = PromptBuilder(project_config, generation_config)
+    
+    if icon_names:
+        unknown = set(icon_names) - {icon_config.name for icon_config in icon_configs}
+        if unknown:
+            raise ValueError(f"Unknown icons: {', '.join(sorted(unknown))}")
+        icon_configs = [icon_config for icon_config in icon_configs if icon_config.name in icon_names]
     
+    prompts = [{'name': icon_config.name, 'prompt': prompt_builder.build(icon_config)} for icon_config in icon_configs]
+    if as_json:
+        print(json.dumps(prompts, indent=2))
+        return
+    for entry in prompts:
+        print(f"=== {entry['name']} ===\n{entry['prompt']}\n")
+
+
+async def generate(args) -> int:
+    """Run the generate command"""
     try:
-        generator = ConfigurableIconGenerator(config_file)
-        results = await generator.generate_all_icons()
+        generator = ConfigurableIconGenerator(args.config_file, cache_mode=args.cache_mode,
+                                              incremental=args.incremental, backend=args.backend)
+        try:
+            results = await generator.generate_all_icons(resume=args.resume)
+        finally:
+            await generator.aclose()
         
         successful = sum(1 for r in results if r.success)
         total = len(results)
@@ -681,6 +3073,335 @@ async def main():
         logger.error(f"Generation failed: {e}")
         return 1
 
+def collect_config_paths(paths: List[str]) -> List[str]:
+    """Expand directories into the *.config.json files they contain"""
+    config_paths = []
+    for path in paths:
+        if Path(path).is_dir():
+            config_paths.extend(str(config_path) for config_path in sorted(Path(path).glob('*.config.json')))
+        else:
+            config_paths.append(path)
+    return config_paths
+
+
+def summarize_batch(config_paths: List[str], generators: List[ConfigurableIconGenerator],
+                    config_results: List[List[IconResult]], shared_resources: Dict[str, int],
+                    requests: List[str], wall_time: float) -> Dict[str, Any]:
+    """Combined report of a batch, per config and over all icons"""
+    configs = []
+    for config_path, generator, results in zip(config_paths, generators, config_results):
+        successful = [r for r in results if r.success]
+        configs.append({
+            'config': config_path,
+            'project': generator.project_config.name,
+            'output_directory': str(generator.output_path),
+            'total_icons': len(results),
+            'successful': len(successful),
+            'failed': len(results) - len(successful),
+            'skipped': sum(1 for r in successful if r.metadata.get('build_status') == 'up_to_date'),
+            'api_calls': sum(1 for r in results for span in r.spans if span['stage'] == 'api_call'),
+            'cache_hits': sum(1 for r in results if r.metadata.get('cache_hit')),
+            'shared_requests': sum(1 for r in results if r.metadata.get('shared_request')),
+            'failed_icons': [{'name': r.name, 'error': r.error} for r in results if not r.success]
+        })
+    
+    all_results = [result for results in config_results for result in results]
+    totals = {key: sum(config[key] for config in configs)
+              for key in ('total_icons', 'successful', 'failed', 'skipped', 'api_calls', 'cache_hits', 'shared_requests')}
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'summary': {
+            'configs': len(configs),
+            **totals,
+            'success_rate': totals['successful'] / totals['total_icons'] * 100 if totals['total_icons'] else 0,
+            'wall_time': wall_time,
+            'planned_requests': len(requests),
+            'unique_requests': len(set(requests))
+        },
+        'shared_resources': shared_resources,
+        'configs': configs,
+        'stage_histograms': _aggregate_stage_spans(all_results)
+    }
+
+
+async def generate_batch(args) -> int:
+    """Run the batch command: validate every config, then generate them all through one shared runtime"""
+    config_paths = collect_config_paths(args.paths)
+    if not config_paths:
+        logger.error("No configuration files found")
+        return 1
+    
+    # Validate everything before spending anything
+    if validate_configs(config_paths):
+        logger.error("Batch aborted, fix the invalid configurations first")
+        return 1
+    
+    runtime = SharedRuntime()
+    generators: List[ConfigurableIconGenerator] = []
+    try:
+        for config_path in config_paths:
+            generators.append(ConfigurableIconGenerator(config_path, cache_mode=args.cache_mode,
+                                                        incremental=args.incremental, backend=args.backend,
+                                                        runtime=runtime))
+        
+        output_paths = [generator.output_path.resolve() for generator in generators]
+        if len(set(output_paths)) != len(output_paths):
+            logger.error("Batch aborted, configurations must use distinct output directories")
+            return 1
+        
+        requests = [request_key for generator in generators for request_key in generator.plan_requests()]
+        logger.info(f"📚 Batch of {len(generators)} configs: {len(requests)} icons to generate, "
+                    f"{len(set(requests))} unique requests")
+        
+        start_time = time.time()
+        config_results = await asyncio.gather(*(generator.generate_all_icons(resume=args.resume)
+                                                for generator in generators))
+        wall_time = time.time() - start_time
+        shared_resources = runtime.resource_counts()
+    except Exception as e:
+        logger.error(f"Batch failed: {e}")
+        return 1
+    finally:
+        for generator in generators:
+            await generator.aclose()
+        await runtime.aclose()
+        runtime.close()
+    
+    report = summarize_batch(config_paths, generators, config_results, shared_resources, requests, wall_time)
+    report_path = Path(args.report or f"batch_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    
+    summary = report['summary']
+    print(f"\n🎉 Batch complete: {summary['successful']}/{summary['total_icons']} icons from "
+          f"{summary['configs']} configs in {wall_time:.1f}s, {summary['api_calls']} API calls, "
+          f"{summary['shared_requests']} shared requests")
+    print(f"📄 Batch report saved: {report_path}")
+    return 0 if summary['failed'] == 0 else 1
+
+class ConfigWatcher:
+    """Regenerates the icons a save changed whenever a watched config file is written.
+    
+    Polls modification times, so it needs no extra dependency. One
+    SharedRuntime lives for the whole session, which keeps the API client
+    connected and the rembg model loaded in the worker pool between saves.
+    Latency is measured from the file's modification time to the moment the
+    updated PNG is on disk.
+    """
+    
+    def __init__(self, paths: List[str], interval: float = 0.5, cache_mode: str = 'use',
+                 backend: Optional[str] = None):
+        self.paths = paths
+        self.interval = interval
+        self.cache_mode = cache_mode
+        self.backend = backend
+        self.runtime = SharedRuntime()
+        self.latencies: List[float] = []
+        self._snapshot_stats: Dict[str, tuple] = {}
+    
+    def _snapshot(self) -> Dict[str, tuple]:
+        snapshot = {}
+        for config_path in collect_config_paths(self.paths):
+            try:
+                stat = os.stat(config_path)
+            except FileNotFoundError:
+                continue
+            snapshot[config_path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+    
+    async def _changed_paths(self) -> Dict[str, tuple]:
+        """Wait for saves, returns the changed paths once they stopped changing for a moment"""
+        while True:
+            await asyncio.sleep(self.interval)
+            snapshot = self._snapshot()
+            if snapshot == self._snapshot_stats:
+                continue
+            # Editors may write a file in several steps, let it settle before reading it
+            while True:
+                await asyncio.sleep(min(self.interval, 0.1))
+                settled = self._snapshot()
+                if settled == snapshot:
+                    break
+                snapshot = settled
+            changed = {path: stat for path, stat in snapshot.items() if self._snapshot_stats.get(path) != stat}
+            self._snapshot_stats = snapshot
+            if changed:
+                return changed
+    
+    async def update(self, config_path: str, saved_at: Optional[float] = None):
+        """Regenerate the changed icons of one config, saved_at is the save time to measure latency from"""
+        try:
+            generator = ConfigurableIconGenerator(config_path, cache_mode=self.cache_mode, incremental=True,
+                                                  backend=self.backend, runtime=self.runtime)
+        except Exception as e:
+            logger.error(f"❌ {config_path}: {e}")
+            return
+        
+        try:
+            changed = generator.changed_icons()
+            if not changed:
+                logger.info(f"👀 {config_path}: no icon changes")
+                return
+            logger.info(f"👀 {config_path}: updating {', '.join(icon_config.name for icon_config in changed)}")
+            
+            latencies = []
+            
+            def on_result(result: IconResult):
+                if not result.success or saved_at is None:
+                    return
+                latency = time.time() - saved_at
+                latencies.append(latency)
+                logger.info(f"🔁 {result.name} updated {latency:.2f}s after save "
+                            f"({result.metadata.get('build_status')})")
+            
+            await generator.warm_up()
+            await generator.update_icons(changed, on_result)
+            
+            if latencies:
+                self.latencies.extend(latencies)
+                logger.info(f"⏱️ Save to PNG for {len(latencies)} icons: fastest {min(latencies):.2f}s, "
+                            f"slowest {max(latencies):.2f}s")
+        finally:
+            await generator.aclose()
+    
+    async def run(self):
+        """Bring every config up to date once, then update icons on each save until cancelled"""
+        self._snapshot_stats = self._snapshot()
+        for config_path in self._snapshot_stats:
+            await self.update(config_path)
+        logger.info(f"👀 Watching {len(self._snapshot_stats)} config(s) for changes, press Ctrl+C to stop")
+        
+        while True:
+            changed = await self._changed_paths()
+            for config_path, (mtime_ns, _) in changed.items():
+                await self.update(config_path, saved_at=mtime_ns / 1e9)
+    
+    def summary(self) -> Dict[str, Any]:
+        """Save to PNG latency over the session"""
+        if not self.latencies:
+            return {'icons_updated': 0}
+        latencies = np.array(self.latencies)
+        return {
+            'icons_updated': len(latencies),
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'max': float(latencies.max())
+        }
+    
+    async def aclose(self):
+        await self.runtime.aclose()
+        self.runtime.close()
+
+
+async def watch(args) -> int:
+    """Run the watch command until interrupted"""
+    watcher = ConfigWatcher(args.paths, interval=args.interval, cache_mode=args.cache_mode, backend=args.backend)
+    try:
+        await watcher.run()
+    finally:
+        await watcher.aclose()
+        summary = watcher.summary()
+        if summary['icons_updated']:
+            print(f"\n⏱️ Save to PNG over {summary['icons_updated']} icon updates: p50 {summary['p50']:.2f}s, "
+                  f"p95 {summary['p95']:.2f}s, max {summary['max']:.2f}s")
+    return 0
+
+COMMANDS = ('generate', 'batch', 'watch', 'validate', 'print-prompts')
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main function"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="Generate icons from a JSON configuration",
+        epilog="Example: python icon_generator_v2.py health-app-icons.config.json"
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    generate_parser = commands.add_parser('generate', help="Generate icons (default when no command is given)")
+    generate_parser.add_argument('config_file', help="Path to icon configuration JSON file")
+    cache_group = generate_parser.add_mutually_exclusive_group()
+    cache_group.add_argument('--no-cache', dest='cache_mode', action='store_const', const='bypass',
+                             help="Bypass the response cache entirely")
+    cache_group.add_argument('--refresh-cache', dest='cache_mode', action='store_const', const='refresh',
+                             help="Ignore cached responses but store fresh ones")
+    generate_parser.set_defaults(cache_mode='use')
+    generate_parser.add_argument('--incremental', action='store_true', default=None,
+                                 help="Skip icons that are up to date with the output manifest")
+    generate_parser.add_argument('--backend', choices=['gemini', 'synthetic'],
+                                 help="Override ai_settings.backend, 'synthetic' runs offline without the live API")
+    generate_parser.add_argument('--resume', action='store_true',
+                                 help="Resume an interrupted run from its journal, generating only pending or failed icons")
+    
+    batch_parser = commands.add_parser('batch', help="Generate many configurations in one process, "
+                                                     "sharing clients, rate limits and workers")
+    batch_parser.add_argument('paths', nargs='+', help="Configuration JSON files or directories of *.config.json")
+    batch_cache_group = batch_parser.add_mutually_exclusive_group()
+    batch_cache_group.add_argument('--no-cache', dest='cache_mode', action='store_const', const='bypass',
+                                   help="Bypass the response cache entirely")
+    batch_cache_group.add_argument('--refresh-cache', dest='cache_mode', action='store_const', const='refresh',
+                                   help="Ignore cached responses but store fresh ones")
+    batch_parser.set_defaults(cache_mode='use')
+    batch_parser.add_argument('--incremental', action='store_true', default=None,
+                              help="Skip icons that are up to date with their output manifest")
+    batch_parser.add_argument('--backend', choices=['gemini', 'synthetic'],
+                              help="Override ai_settings.backend of every configuration")
+    batch_parser.add_argument('--resume', action='store_true',
+                              help="Resume interrupted runs from their journals")
+    batch_parser.add_argument('--report', help="Combined report path (default: batch_report_<timestamp>.json)")
+    
+    watch_parser = commands.add_parser('watch', help="Keep models warm and update icons whenever a configuration "
+                                                     "is saved")
+    watch_parser.add_argument('paths', nargs='+', help="Configuration JSON files or directories of *.config.json")
+    watch_cache_group = watch_parser.add_mutually_exclusive_group()
+    watch_cache_group.add_argument('--no-cache', dest='cache_mode', action='store_const', const='bypass',
+                                   help="Bypass the response cache entirely")
+    watch_cache_group.add_argument('--refresh-cache', dest='cache_mode', action='store_const', const='refresh',
+                                   help="Ignore cached responses but store fresh ones")
+    watch_parser.set_defaults(cache_mode='use')
+    watch_parser.add_argument('--backend', choices=['gemini', 'synthetic'],
+                              help="Override ai_settings.backend of every configuration")
+    watch_parser.add_argument('--interval', type=float, default=0.5, help="Seconds between checks for changes")
+    
+    validate_parser = commands.add_parser('validate', help="Check configurations without generating anything")
+    validate_parser.add_argument('config_files', nargs='+', help="Icon configuration JSON files")
+    validate_parser.add_argument('--schema', help="Schema to validate against (default: icon-config.schema.json "
+                                                  "next to this script)")
+    
+    prompts_parser = commands.add_parser('print-prompts', help="Print the resolved prompt of each icon")
+    prompts_parser.add_argument('config_file', help="Path to icon configuration JSON file")
+    prompts_parser.add_argument('--icon', dest='icons', action='append', help="Only this icon, repeatable")
+    prompts_parser.add_argument('--json', action='store_true', help="Print prompts as a JSON array")
+    
+    # `icon_generator_v2.py config.json` keeps meaning `generate config.json`
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        argv.insert(0, 'generate')
+    args = parser.parse_args(argv)
+    
+    if args.command == 'validate':
+        configure_logging(verbose=False, log_file=None)
+        return 1 if validate_configs(args.config_files, args.schema) else 0
+    
+    if args.command == 'print-prompts':
+        configure_logging(verbose=False, log_file=None)
+        try:
+            print_prompts(args.config_file, args.icons, args.json)
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot print prompts: {e}")
+            return 1
+        return 0
+    
+    configure_logging()
+    if args.command == 'batch':
+        return asyncio.run(generate_batch(args))
+    if args.command == 'watch':
+        try:
+            return asyncio.run(watch(args))
+        except KeyboardInterrupt:
+            return 0
+    return asyncio.run(generate(args))
+
 if __name__ == "__main__":
-    exit_code = asyncio.run(main())
-    exit(exit_code)
\ No newline at end of file
+    exit_code = main()
+    exit(exit_code)
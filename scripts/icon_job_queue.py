@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+🗂️ Icon Job Queue
+SQLite-backed queue of icon generation jobs with one task per icon. Tasks
+are leased to workers, so work held by a crashed or restarted process
+returns to the queue
+"""
+
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any, Union
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """Persistent queue of jobs and their per-icon tasks.
+    
+    Safe to share between threads and processes: every thread gets its own
+    connection and claims run in IMMEDIATE transactions, so a task is never
+    leased to two workers at once. A lease expires unless its owner renews
+    it, which hands the task of a dead worker to the next one that claims.
+    WAL journaling needs shared memory, use journal_mode='DELETE' when
+    processes on several hosts open the queue on shared storage.
+    """
+    
+    # Task states, a job is finished once none of its tasks is pending or running
+    TASK_STATES = ('pending', 'running', 'done', 'failed', 'cancelled')
+    
+    def __init__(self, path: Union[str, Path] = '.icon_service/queue.sqlite', lease_seconds: float = 60.0,
+                 max_attempts: int = 3, journal_mode: str = 'WAL'):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        self._create_tables()
+    
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the calling thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+    
+    def _create_tables(self):
+        self.connection.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                config_path TEXT NOT NULL,
+                options TEXT NOT NULL,
+                submitted_at TEXT NOT NULL,
+                finished_at TEXT,
+                report TEXT
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                job_id TEXT NOT NULL REFERENCES jobs (id),
+                icon TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (job_id, icon)
+            );
+            CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, lease_expires);
+        """)
+    
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front, so read-then-update is atomic"""
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+    
+    def submit(self, config_path: str, icon_names: List[str], options: Optional[Dict[str, Any]] = None,
+               job_id: Optional[str] = None) -> str:
+        """Queue a job with one task per icon, returns the job id"""
+        job_id = job_id or uuid.uuid4().hex[:12]
+        now = datetime.now().isoformat()
+        with self._transaction() as connection:
+            connection.execute("INSERT INTO jobs (id, config_path, options, submitted_at) VALUES (?, ?, ?, ?)",
+                               (job_id, config_path, json.dumps(options or {}), now))
+            connection.executemany(
+                "INSERT INTO tasks (job_id, icon, position, updated_at) VALUES (?, ?, ?, ?)",
+                [(job_id, icon_name, position, now) for position, icon_name in enumerate(icon_names)])
+        return job_id
+    
+    def requeue_expired(self) -> int:
+        """Return tasks whose lease ran out to the queue, or fail them after max_attempts"""
+        now = datetime.now().isoformat()
+        with self._transaction() as connection:
+            failed = connection.execute(
+                "UPDATE tasks SET status = 'failed', lease_owner = NULL, updated_at = ?, result = ? "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, json.dumps({'success': False, 'error': 'Lease expired too many times'}),
+                 time.time(), self.max_attempts)).rowcount
+            requeued = connection.execute(
+                "UPDATE tasks SET status = 'pending', lease_owner = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_expires < ?", (now, time.time())).rowcount
+        if requeued or failed:
+            logger.warning(f"♻️ Requeued {requeued} tasks with expired leases, failed {failed}")
+        return requeued
+    
+    def claim(self, owner: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """Lease up to limit pending tasks to owner, oldest job first"""
+        if limit <= 0:
+            return []
+        self.requeue_expired()
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT tasks.job_id, tasks.icon, tasks.attempts, jobs.config_path, jobs.options "
+                "FROM tasks JOIN jobs ON jobs.id = tasks.job_id WHERE tasks.status = 'pending' "
+                "ORDER BY jobs.submitted_at, tasks.position LIMIT ?", (limit,)).fetchall()
+            expires = time.time() + self.lease_seconds
+            connection.executemany(
+                "UPDATE tasks SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE job_id = ? AND icon = ?",
+                [(owner, expires, datetime.now().isoformat(), row['job_id'], row['icon']) for row in rows])
+        return [{
+            'job_id': row['job_id'],
+            'icon': row['icon'],
+            'attempt': row['attempts'] + 1,
+            'config_path': row['config_path'],
+            'options': json.loads(row['options'])
+        } for row in rows]
+    
+    def renew(self, owner: str, tasks: List[tuple]) -> int:
+        """Extend the leases owner holds on (job_id, icon) tasks, returns how many are still held"""
+        expires = time.time() + self.lease_seconds
+        with self._transaction() as connection:
+            return sum(connection.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE job_id = ? AND icon = ? "
+                "AND status = 'running' AND lease_owner = ?", (expires, job_id, icon, owner)).rowcount
+                for job_id, icon in tasks)
+    
+    def complete(self, job_id: str, icon: str, owner: str, success: bool, result: Dict[str, Any]) -> bool:
+        """Record the outcome of a leased task.
+        
+        Ignored when owner no longer holds the lease. Returns True when this
+        was the job's last open task, the caller then finishes the job.
+        """
+        with self._transaction() as connection:
+            updated = connection.execute(
+                "UPDATE tasks SET status = ?, result = ?, lease_owner = NULL, updated_at = ? "
+                "WHERE job_id = ? AND icon = ? AND status = 'running' AND lease_owner = ?",
+                ('done' if success else 'failed', json.dumps(result, default=str), datetime.now().isoformat(),
+                 job_id, icon, owner)).rowcount
+            if not updated:
+                logger.warning(f"Lease on {job_id}/{icon} was lost, result discarded")
+                return False
+            open_tasks = connection.execute(
+                "SELECT COUNT(*) FROM tasks WHERE job_id = ? AND status IN ('pending', 'running')",
+                (job_id,)).fetchone()[0]
+        return open_tasks == 0
+    
+    def release_owner(self, owner: str) -> int:
+        """Return every task leased to owner to the queue, used on shutdown and restart"""
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE tasks SET status = 'pending', lease_owner = NULL, attempts = MAX(attempts - 1, 0), "
+                "updated_at = ? WHERE status = 'running' AND lease_owner = ?",
+                (datetime.now().isoformat(), owner)).rowcount
+    
+    def cancel(self, job_id: str) -> tuple[int, bool]:
+        """Cancel the job's pending tasks, running ones finish normally.
+        
+        Returns the number of cancelled tasks and whether the job has no
+        running task left, in which case the caller finishes it.
+        """
+        with self._transaction() as connection:
+            cancelled = connection.execute(
+                "UPDATE tasks SET status = 'cancelled', updated_at = ? WHERE job_id = ? AND status = 'pending'",
+                (datetime.now().isoformat(), job_id)).rowcount
+            running = connection.execute(
+                "SELECT COUNT(*) FROM tasks WHERE job_id = ? AND status = 'running'", (job_id,)).fetchone()[0]
+        return cancelled, cancelled > 0 and running == 0
+    
+    def unfinished_jobs(self) -> List[str]:
+        """Jobs whose tasks are all closed but that were never finished, e.g. after a crash"""
+        return [row[0] for row in self.connection.execute(
+            "SELECT id FROM jobs WHERE finished_at IS NULL AND NOT EXISTS ("
+            "SELECT 1 FROM tasks WHERE tasks.job_id = jobs.id AND tasks.status IN ('pending', 'running'))")]
+    
+    def finish(self, job_id: str, report: Optional[Dict[str, Any]] = None):
+        """Mark a job finished once its outputs are written"""
+        with self._transaction() as connection:
+            connection.execute("UPDATE jobs SET finished_at = ?, report = ? WHERE id = ?",
+                               (datetime.now().isoformat(), json.dumps(report), job_id))
+    
+    @staticmethod
+    def _job_status(counts: Dict[str, int], finished: bool) -> str:
+        if counts.get('running'):
+            return 'running'
+        if counts.get('pending'):
+            return 'running' if counts.get('done') or counts.get('failed') else 'queued'
+        if not finished:
+            return 'finishing'
+        if counts.get('failed'):
+            return 'failed'
+        return 'cancelled' if counts.get('cancelled') and not counts.get('done') else 'done'
+    
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job with its status and per-icon tasks, None when unknown"""
+        row = self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        tasks = [{
+            'icon': task['icon'],
+            'status': task['status'],
+            'attempts': task['attempts'],
+            'worker': task['lease_owner'],
+            'result': json.loads(task['result']) if task['result'] else None,
+            'updated_at': task['updated_at']
+        } for task in self.connection.execute(
+            "SELECT * FROM tasks WHERE job_id = ? ORDER BY position", (job_id,)).fetchall()]
+        counts = {state: sum(1 for task in tasks if task['status'] == state) for state in self.TASK_STATES}
+        return {
+            'id': row['id'],
+            'status': self._job_status(counts, row['finished_at'] is not None),
+            'config_path': row['config_path'],
+            'options': json.loads(row['options']),
+            'submitted_at': row['submitted_at'],
+            'finished_at': row['finished_at'],
+            'counts': counts,
+            'report': json.loads(row['report']) if row['report'] else None,
+            'tasks': tasks
+        }
+    
+    def jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent jobs with task counts, without per-task details"""
+        rows = self.connection.execute(
+            "SELECT jobs.id, jobs.submitted_at, jobs.finished_at, tasks.status, COUNT(*) AS count "
+            "FROM jobs JOIN tasks ON tasks.job_id = jobs.id "
+            "WHERE jobs.id IN (SELECT id FROM jobs ORDER BY submitted_at DESC LIMIT ?) "
+            "GROUP BY jobs.id, tasks.status ORDER BY jobs.submitted_at DESC", (limit,)).fetchall()
+        jobs: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            job = jobs.setdefault(row['id'], {'id': row['id'], 'submitted_at': row['submitted_at'],
+                                              'finished_at': row['finished_at'], 'counts': {}})
+            job['counts'][row['status']] = row['count']
+        for job in jobs.values():
+            job['status'] = self._job_status(job['counts'], job['finished_at'] is not None)
+        return list(jobs.values())
+    
+    def counts(self, job_id: Optional[str] = None) -> Dict[str, int]:
+        """Number of tasks in each state, of one job or over the whole queue"""
+        if job_id is None:
+            rows = self.connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        else:
+            rows = self.connection.execute("SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status",
+                                           (job_id,)).fetchall()
+        return {state: 0 for state in self.TASK_STATES} | {status: count for status, count in rows}
+    
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+"""
+🛰️ Icon Generation Service
+Long-lived local service in front of the icon generator. Clients submit
+configurations over a small JSON API on TCP or a Unix socket, one
+scheduler runs every icon through a warm shared runtime and request
+budget, and a SQLite queue keeps jobs across restarts
+"""
+
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+import argparse
+import mimetypes
+import threading
+import http.client
+from pathlib import Path
+from urllib.parse import urlparse, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Dict, List, Optional, Any, Set
+
+import icon_generator_v2 as generator
+from icon_job_queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+
+
+class IconService:
+    """Scheduler running queued icon tasks through one SharedRuntime.
+    
+    A job is a configuration stored in the data directory, each of its icons
+    a queued task. Up to max_tasks icons are in flight at once. API calls of
+    every job using a model go through one rate limiter and one set of API
+    slots, sized by the quota settings when given and otherwise by the first
+    job using that model. Post-processing runs in one warm worker pool.
+    Leases are renewed while tasks run and handed back on shutdown.
+    
+    Jobs only write inside output_root, the jobs directory unless the
+    service is started with another one.
+    
+    With finish_jobs off the service only works through tasks, several of
+    them can then share one queue while a coordinator finishes the jobs.
+    """
+    
+    def __init__(self, data_dir: str = '.icon_service', worker_id: Optional[str] = None,
+                 backend: Optional[str] = None, max_tasks: int = 8, quota: Optional[Dict[str, Any]] = None,
+                 lease_seconds: float = 60.0, finish_jobs: bool = True, journal_mode: str = 'WAL',
+                 output_root: Optional[str] = None):
+        self.data_dir = Path(data_dir)
+        self.jobs_dir = self.data_dir / 'jobs'
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.output_root = Path(output_root or self.jobs_dir).resolve()
+        self.queue = JobQueue(self.data_dir / 'queue.sqlite', lease_seconds=lease_seconds, journal_mode=journal_mode)
+        self.worker_id = worker_id or f"service@{socket.gethostname()}"
+        self.backend = backend
+        self.max_tasks = max(1, max_tasks)
+        self.finish_jobs = finish_jobs
+        self.quota = quota or {}
+        self.runtime = generator.SharedRuntime()
+        self.config_loader = generator.ConfigLoader()
+        self._generators: Dict[str, generator.ConfigurableIconGenerator] = {}
+        self._running: Dict[tuple, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+    
+    def _notify(self):
+        """Wake the scheduler, safe to call from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+    
+    def _check_output_path(self, path: Path, setting: str):
+        """Raise ValueError unless the resolved path is inside the output root"""
+        if not path.resolve().is_relative_to(self.output_root):
+            raise ValueError(f"{setting} {path} is outside the service output root {self.output_root}")
+    
+    def submit(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate and queue a job, raises ValueError listing every problem found"""
+        config = payload.get('config')
+        if not isinstance(config, dict):
+            raise ValueError("Request body needs a 'config' object")
+        problems = self.config_loader.validation_errors(config) or self.config_loader.check_config(config)
+        if problems:
+            raise ValueError('; '.join(problems))
+        
+        icon_names = [icon['name'] for icon in config['icons']]
+        requested = payload.get('icons') or icon_names
+        unknown = set(requested) - set(icon_names)
+        if unknown:
+            raise ValueError(f"Unknown icons: {', '.join(sorted(unknown))}")
+        options = {
+            'cache_mode': payload.get('cache_mode', 'use'),
+            'incremental': bool(payload.get('incremental', False))
+        }
+        if options['cache_mode'] not in generator.ConfigurableIconGenerator.CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {options['cache_mode']}")
+        
+        # Relative output directories land in the job directory, quota settings are the service's
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = self.jobs_dir / job_id
+        output = config['generation']['output']
+        output_dir = (job_dir / output.get('directory', './generated-icons')).resolve()
+        self._check_output_path(output_dir, 'output.directory')
+        self._check_output_path(output_dir / output.get('export', {}).get('directory', 'exports'),
+                                'output.export.directory')
+        self._check_output_path(output_dir / output.get('dedup', {}).get('index_path', '.icon_index.sqlite'),
+                                'output.dedup.index_path')
+        output['directory'] = str(output_dir)
+        config['generation'].setdefault('ai_settings', {}).update(self.quota)
+        
+        config_path = job_dir / 'config.json'
+        generator._atomic_write(config_path, json.dumps(config, indent=2).encode('utf-8'))
+        self.queue.submit(str(config_path), requested, options, job_id=job_id)
+        self._notify()
+        
+        logger.info(f"📥 Queued job {job_id}: {config['project']['name']}, {len(requested)} icons")
+        return self.job(job_id)
+    
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status with the output files clients can fetch"""
+        job = self.queue.job(job_id)
+        if job is not None:
+            job['files'] = sorted(self._job_files(job))
+        return job
+    
+    @staticmethod
+    def _job_output(job: Dict[str, Any]) -> Dict[str, Any]:
+        with open(job['config_path'], 'r', encoding='utf-8') as f:
+            return json.load(f)['generation']['output']
+    
+    def _job_files(self, job: Dict[str, Any]) -> Set[str]:
+        """Output files of the job relative to its output directory"""
+        export_dir = self._job_output(job).get('export', {}).get('directory', 'exports')
+        files = set()
+        for task in job['tasks']:
+            entry = (task['result'] or {}).get('manifest_entry') or {}
+            files.update(entry.get('files', {}).values())
+            files.update(f"{export_dir}/{path}" for path in entry.get('exports', []))
+        return files
+    
+    def job_file(self, job_id: str, relative_path: str) -> Optional[Path]:
+        """Path of an output file of the job, None unless the job produced it"""
+        job = self.queue.job(job_id)
+        if job is None or relative_path not in self._job_files(job):
+            return None
+        return Path(self._job_output(job)['directory']) / relative_path
+    
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a job's pending icons, None when the job is unknown"""
+        if self.queue.job(job_id) is None:
+            return None
+        cancelled, needs_finish = self.queue.cancel(job_id)
+        if needs_finish and self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.finish_job(job_id), self._loop)
+        logger.info(f"🛑 Cancelled {cancelled} pending icons of job {job_id}")
+        return self.job(job_id)
+    
+    def _generator(self, job_id: str, config_path: str, options: Dict[str, Any]
+                   ) -> generator.ConfigurableIconGenerator:
+        """Generator of a job, kept while the job has icons in flight"""
+        job_generator = self._generators.get(job_id)
+        if job_generator is None:
+            job_generator = generator.ConfigurableIconGenerator(
+                config_path, cache_mode=options.get('cache_mode', 'use'),
+                incremental=options.get('incremental', False), backend=self.backend, runtime=self.runtime)
+            # Icons of one job form one run wherever they are generated
+            job_generator.journal.run_id = job_id
+            self._generators[job_id] = job_generator
+        return job_generator
+    
+    async def _run_task(self, task: Dict[str, Any]):
+        job_id, icon_name = task['job_id'], task['icon']
+        try:
+            job_generator = self._generator(job_id, task['config_path'], task['options'])
+            icon_config = next((c for c in job_generator.icon_configs if c.name == icon_name), None)
+            if icon_config is None:
+                raise ValueError(f"Icon {icon_name} is not in the job configuration")
+            result = await job_generator.generate_single_icon(icon_config)
+            success = result.success
+            manifest_entry = job_generator.manifest['icons'].get(icon_name) if result.success else None
+            outcome = generator.RunJournal.to_event(result, manifest_entry)
+        except Exception as e:
+            logger.error(f"❌ Task {job_id}/{icon_name} failed: {e}")
+            success = False
+            outcome = {'name': icon_name, 'success': False, 'error': str(e)}
+        outcome['worker'] = self.worker_id
+        
+        if self.queue.complete(job_id, icon_name, self.worker_id, success, outcome) and self.finish_jobs:
+            await self.finish_job(job_id)
+    
+    @staticmethod
+    def _workers_summary(job: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Icons, failures, retried leases and busy time per worker that produced a result"""
+        workers = {}
+        for task in job['tasks']:
+            if not task['result']:
+                continue
+            stats = workers.setdefault(task['result'].get('worker', 'unknown'),
+                                       {'icons': 0, 'failed': 0, 'retried': 0, 'busy_time': 0.0})
+            stats['icons'] += 1
+            stats['failed'] += 0 if task['result'].get('success') else 1
+            stats['retried'] += 1 if task['attempts'] > 1 else 0
+            stats['busy_time'] += task['result'].get('generation_time', 0.0)
+        return workers
+    
+    async def finish_job(self, job_id: str) -> Dict[str, Any]:
+        """Write the manifest, atlases and generation report of a job once none of its icons is open.
+        
+        Results come from the queue, so they merge icons generated by any
+        worker and before any restart. Returns the job report.
+        """
+        job = self.queue.job(job_id)
+        job_generator = self._generators.pop(job_id, None)
+        try:
+            if job_generator is None:
+                job_generator = generator.ConfigurableIconGenerator(
+                    job['config_path'], backend=self.backend, runtime=self.runtime)
+            results = []
+            for task in job['tasks']:
+                if task['result']:
+                    results.append(generator.RunJournal.to_result({'name': task['icon'], **task['result']}))
+                    if task['result'].get('manifest_entry'):
+                        job_generator.manifest['icons'][task['icon']] = task['result']['manifest_entry']
+            atlas_report = await job_generator.write_outputs()
+            report_path = job_generator._generate_summary_report(results, atlas_report, self._workers_summary(job))
+            report = {'output_directory': str(job_generator.output_path), 'report_path': str(report_path),
+                      'atlases': atlas_report}
+            logger.info(f"✅ Job {job_id} finished: {job['counts']['done']} done, {job['counts']['failed']} failed")
+        except Exception as e:
+            logger.error(f"❌ Could not finish job {job_id}: {e}")
+            report = {'error': str(e)}
+        finally:
+            if job_generator is not None:
+                await job_generator.aclose()
+        self.queue.finish(job_id, report)
+        return report
+    
+    async def run(self, exit_when_idle: bool = False):
+        """Schedule queued icons until cancelled, or until no icon of any job is open when exit_when_idle"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        
+        released = self.queue.release_owner(self.worker_id)
+        if released:
+            logger.info(f"♻️ Requeued {released} icons left running by the previous service run")
+        if self.finish_jobs:
+            for job_id in self.queue.unfinished_jobs():
+                await self.finish_job(job_id)
+        
+        renew_interval = self.queue.lease_seconds / 3
+        last_renewal = time.monotonic()
+        while True:
+            claimed = self.queue.claim(self.worker_id, self.max_tasks - len(self._running))
+            for task in claimed:
+                key = (task['job_id'], task['icon'])
+                self._running[key] = asyncio.create_task(self._run_task(task))
+                self._running[key].add_done_callback(lambda _, key=key: (self._running.pop(key, None),
+                                                                         self._wake.set()))
+            
+            if not claimed and not self._running:
+                # Nothing left to claim, so no cached job generator is needed any more
+                for job_generator in self._generators.values():
+                    await job_generator.aclose()
+                self._generators.clear()
+                counts = self.queue.counts()
+                if exit_when_idle and not counts['pending'] and not counts['running']:
+                    return
+            
+            if self._running and time.monotonic() - last_renewal >= renew_interval:
+                self.queue.renew(self.worker_id, list(self._running))
+                last_renewal = time.monotonic()
+            
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=min(5.0, renew_interval))
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+    
+    def health(self) -> Dict[str, Any]:
+        return {
+            'worker_id': self.worker_id,
+            'in_flight': len(self._running),
+            'max_tasks': self.max_tasks,
+            'tasks': self.queue.counts(),
+            'shared_resources': self.runtime.resource_counts()
+        }
+    
+    async def aclose(self):
+        """Stop running icons, hand their leases back and release the runtime"""
+        for task in list(self._running.values()):
+            task.cancel()
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+        released = self.queue.release_owner(self.worker_id)
+        if released:
+            logger.info(f"♻️ Returned {released} unfinished icons to the queue")
+        for job_generator in self._generators.values():
+            await job_generator.aclose()
+        self._generators.clear()
+        await self.runtime.aclose()
+        self.runtime.close()
+        self.queue.close()
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """JSON API of the service.
+    
+    POST /jobs, GET /jobs, GET /jobs/<id>, DELETE /jobs/<id>,
+    GET /jobs/<id>/files/<path> and GET /health.
+    """
+    
+    server_version = 'IconService/1'
+    
+    @property
+    def service(self) -> IconService:
+        return self.server.service
+    
+    def address_string(self) -> str:
+        # Unix socket peers have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+    
+    def log_message(self, format: str, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+    
+    def _send(self, status: int, body: bytes, content_type: str = 'application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_json(self, status: int, payload: Any):
+        self._send(status, json.dumps(payload, indent=2).encode('utf-8'))
+    
+    def _route(self) -> List[str]:
+        return [unquote(part) for part in urlparse(self.path).path.strip('/').split('/') if part]
+    
+    def do_GET(self):
+        parts = self._route()
+        if parts == ['health']:
+            self._send_json(200, self.service.health())
+        elif parts == ['jobs']:
+            self._send_json(200, self.service.queue.jobs())
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = self.service.job(parts[1])
+            self._send_json(200, job) if job else self._send_json(404, {'error': 'Unknown job'})
+        elif len(parts) >= 4 and parts[0] == 'jobs' and parts[2] == 'files':
+            path = self.service.job_file(parts[1], '/'.join(parts[3:]))
+            if path is None or not path.is_file():
+                self._send_json(404, {'error': 'Unknown file'})
+                return
+            self._send(200, path.read_bytes(), mimetypes.guess_type(path.name)[0] or 'application/octet-stream')
+        else:
+            self._send_json(404, {'error': 'Not found'})
+    
+    def do_POST(self):
+        if self._route() != ['jobs']:
+            self._send_json(404, {'error': 'Not found'})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            self._send_json(201, self.service.submit(payload))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': str(e)})
+    
+    def do_DELETE(self):
+        parts = self._route()
+        job = self.service.cancel(parts[1]) if len(parts) == 2 and parts[0] == 'jobs' else None
+        self._send_json(200, job) if job else self._send_json(404, {'error': 'Unknown job'})
+
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket"""
+    
+    def __init__(self, socket_path: str, timeout: float = 30):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+    
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServiceClient:
+    """Client of the service API over TCP or a Unix socket"""
+    
+    def __init__(self, url: str = DEFAULT_URL, socket_path: Optional[str] = None, timeout: float = 30):
+        self.url = urlparse(url)
+        self.socket_path = socket_path
+        self.timeout = timeout
+    
+    def request(self, method: str, path: str, payload: Any = None, raw: bool = False) -> Any:
+        """Send a request, returns decoded JSON unless raw and raises RuntimeError on errors"""
+        if self.socket_path:
+            connection = UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=self.timeout)
+        try:
+            body = json.dumps(payload).encode('utf-8') if payload is not None else None
+            connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            data = response.read()
+        finally:
+            connection.close()
+        
+        if response.status >= 400 or not raw:
+            data = json.loads(data)
+        if response.status >= 400:
+            raise RuntimeError(data.get('error') if isinstance(data, dict) else f"HTTP {response.status}")
+        return data
+    
+    def submit(self, config: Dict[str, Any], icons: Optional[List[str]] = None, incremental: bool = False,
+               cache_mode: str = 'use') -> Dict[str, Any]:
+        return self.request('POST', '/jobs', {'config': config, 'icons': icons, 'incremental': incremental,
+                                              'cache_mode': cache_mode})
+    
+    def job(self, job_id: str) -> Dict[str, Any]:
+        return self.request('GET', f"/jobs/{job_id}")
+    
+    def jobs(self) -> List[Dict[str, Any]]:
+        return self.request('GET', '/jobs')
+    
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        return self.request('DELETE', f"/jobs/{job_id}")
+    
+    def fetch(self, job_id: str, relative_path: str) -> bytes:
+        return self.request('GET', f"/jobs/{job_id}/files/{relative_path}", raw=True)
+    
+    def wait(self, job_id: str, interval: float = 1.0) -> Dict[str, Any]:
+        """Poll until the job is finished"""
+        while True:
+            job = self.job(job_id)
+            if job['finished_at']:
+                return job
+            time.sleep(interval)
+
+
+def make_server(service: IconService, host: str, port: int, socket_path: Optional[str]):
+    """HTTP server on TCP, or on a Unix socket when a path is given"""
+    if socket_path:
+        Path(socket_path).unlink(missing_ok=True)
+        server = UnixHTTPServer(socket_path, ServiceRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.service = service
+    return server
+
+
+async def serve(args) -> int:
+    """Run the service until interrupted"""
+    quota = {}
+    if args.max_concurrency is not None:
+        quota['max_concurrency'] = args.max_concurrency
+    if args.requests_per_minute is not None:
+        quota['rate_limit'] = {'requests_per_minute': args.requests_per_minute, 'burst': args.burst}
+    
+    service = IconService(args.data_dir, worker_id=args.worker_id, backend=args.backend,
+                          max_tasks=args.max_tasks, quota=quota, output_root=args.output_root)
+    server = make_server(service, args.host, args.port, args.socket)
+    threading.Thread(target=server.serve_forever, name='icon-service-http', daemon=True).start()
+    address = args.socket or f"http://{args.host}:{args.port}"
+    logger.info(f"🛰️ Icon service listening on {address}, data in {service.data_dir}")
+    logger.info(f"Jobs write inside {service.output_root}")
+    if not quota:
+        logger.info("Request budget per model taken from the first job using it")
+    
+    try:
+        await service.run()
+    finally:
+        server.shutdown()
+        server.server_close()
+        if args.socket:
+            Path(args.socket).unlink(missing_ok=True)
+        await service.aclose()
+    return 0
+
+
+def _print_job(job: Dict[str, Any]):
+    counts = ', '.join(f"{count} {state}" for state, count in job['counts'].items() if count)
+    print(f"{job['id']}  {job['status']:<10} {counts}")
+    for task in job.get('tasks', []):
+        error = (task['result'] or {}).get('error')
+        print(f"   • {task['icon']}: {task['status']}" + (f" ({error})" if error else ''))
+
+
+def main() -> int:
+    connection_parser = argparse.ArgumentParser(add_help=False)
+    connection_parser.add_argument('--url', default=DEFAULT_URL, help="Service URL")
+    connection_parser.add_argument('--socket', help="Unix socket path, used instead of --url")
+    
+    parser = argparse.ArgumentParser(description="Local icon generation service and its client")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    serve_parser = commands.add_parser('serve', help="Run the service")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="Address to listen on")
+    serve_parser.add_argument('--port', type=int, default=8765, help="Port to listen on")
+    serve_parser.add_argument('--socket', help="Listen on this Unix socket instead of TCP")
+    serve_parser.add_argument('--data-dir', default='.icon_service', help="Queue database and job files")
+    serve_parser.add_argument('--worker-id', help="Lease owner name, keep it stable across restarts")
+    serve_parser.add_argument('--backend', choices=['gemini', 'synthetic'], help="Override ai_settings.backend of every job")
+    serve_parser.add_argument('--max-tasks', type=int, default=8, help="Icons in flight across all jobs")
+    serve_parser.add_argument('--max-concurrency', type=int, help="API calls in flight, imposed on every job")
+    serve_parser.add_argument('--requests-per-minute', type=float, help="API request budget, imposed on every job")
+    serve_parser.add_argument('--burst', type=int, default=4, help="Burst allowance of the request budget")
+    serve_parser.add_argument('--output-root', help="Directory jobs may write to, defaults to the jobs directory. "
+                                                    "Absolute output directories have to be inside it")
+    
+    submit_parser = commands.add_parser('submit', parents=[connection_parser], help="Queue a configuration")
+    submit_parser.add_argument('config_file', help="Path to icon configuration JSON file")
+    submit_parser.add_argument('--icon', dest='icons', action='append', help="Only this icon, repeatable")
+    submit_parser.add_argument('--incremental', action='store_true', help="Skip icons that are up to date")
+    submit_parser.add_argument('--no-cache', dest='cache_mode', action='store_const', const='bypass', default='use',
+                               help="Bypass the response cache")
+    submit_parser.add_argument('--wait', action='store_true', help="Wait for the job to finish")
+    
+    status_parser = commands.add_parser('status', parents=[connection_parser], help="Show one job or recent jobs")
+    status_parser.add_argument('job_id', nargs='?', help="Job to show")
+    
+    fetch_parser = commands.add_parser('fetch', parents=[connection_parser], help="Download a job's output files")
+    fetch_parser.add_argument('job_id', help="Job to download")
+    fetch_parser.add_argument('--output', default='.', help="Directory to download into")
+    
+    cancel_parser = commands.add_parser('cancel', parents=[connection_parser], help="Cancel a job's pending icons")
+    cancel_parser.add_argument('job_id', help="Job to cancel")
+    
+    args = parser.parse_args()
+    
+    if args.command == 'serve':
+        Path(args.data_dir).mkdir(parents=True, exist_ok=True)
+        generator.configure_logging(log_file=str(Path(args.data_dir) / 'service.log'))
+        try:
+            return asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            return 0
+    
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    client = ServiceClient(args.url, args.socket)
+    try:
+        if args.command == 'submit':
+            with open(args.config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            # Relative output directories land in the job directory, fetch downloads them
+            job = client.submit(config, args.icons, args.incremental, args.cache_mode)
+            print(f"📥 Queued job {job['id']} ({len(job['tasks'])} icons)")
+            if args.wait:
+                job = client.wait(job['id'])
+                _print_job(job)
+                return 0 if job['status'] == 'done' else 1
+        elif args.command == 'status':
+            if args.job_id:
+                _print_job(client.job(args.job_id))
+            else:
+                for job in client.jobs():
+                    _print_job(job)
+        elif args.command == 'fetch':
+            job = client.job(args.job_id)
+            for relative_path in job['files']:
+                target = Path(args.output) / relative_path
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(client.fetch(args.job_id, relative_path))
+            print(f"📦 Downloaded {len(job['files'])} files to {args.output}")
+        elif args.command == 'cancel':
+            _print_job(client.cancel(args.job_id))
+    except (OSError, RuntimeError, ValueError) as e:
+        logger.error(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())